@@ -3,7 +3,6 @@ import os
 from datetime import datetime, timedelta
 
 import boto3
-import holidays
 import joblib
 import mlflow
 import numpy as np
@@ -12,6 +11,8 @@ import tensorflow as tf
 from airflow.operators.python import PythonOperator
 from huggingface_hub import HfApi, hf_hub_download
 from meteostat import Hourly, Stations
+from services.calendar_manager import CalendarManager
+from services.weather_manager import WeatherManager
 
 from airflow import DAG
 
@@ -21,6 +22,7 @@ RAW_DIR = os.path.join(SHARED_DIR, 'raw_data')
 PROC_DIR = os.path.join(SHARED_DIR, 'dataset')
 HF_CLONE_DIR = os.path.join(SHARED_DIR, 'hf_repo')
 MODEL_DIR = '/opt/airflow/models/lstm_v2'
+WEATHER_FILE = '/opt/airflow/data/weather.csv'
 # Параметры
 BUCKET = 'mfdpproject'
 REPO_ID = 'Lucky239/mfdp'
@@ -97,42 +99,18 @@ def aggregate_trips_file(input_path: str) -> str:
 
 def engineer_features_file(input_path: str) -> str:
     df = pd.read_csv(input_path)
-    us_holidays = holidays.US()
-    non_working = {'New Year\'s Day', 'MLK Day', 'Washington\'s Birthday', 'Memorial Day',
-                   'Juneteenth', 'Independence Day', 'Labor Day', 'Thanksgiving', 'Christmas Day'}
     df['date'] = pd.to_datetime(df['date'])
-    df['day_of_week'] = df['date'].dt.dayofweek
-    df['month'] = df['date'].dt.month
-    df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
-    df['is_holiday'] = (
-        df['date']
-        .apply(lambda d: (us_holidays.get(d.date()) in non_working) if pd.notnull(d) else False)
-        .astype(int)
-    )
-    df['is_month_start'] = df['date'].dt.is_month_start.astype(int)
-    df['is_month_end'] = df['date'].dt.is_month_end.astype(int)
-    df['day_of_year'] = df['date'].dt.dayofyear
-    df['week_of_year'] = df['date'].dt.isocalendar().week.astype(int)
-    df['is_pre_holiday'] = (
-        df['date']
-        .shift(-1)
-        .apply(lambda d: (us_holidays.get(d.date()) in non_working) if pd.notnull(d) else False)
-        .astype(int)
-    )
-
-    df['is_post_holiday'] = (
-        df['date']
-        .shift(1)
-        .apply(lambda d: (us_holidays.get(d.date()) in non_working) if pd.notnull(d) else False)
-        .astype(int)
-    )
+    calendar = CalendarManager.features(df['date'], df['hour'])
+    for col in [
+        'day_of_week', 'month', 'is_weekend', 'is_holiday', 'is_month_start', 'is_month_end',
+        'day_of_year', 'week_of_year', 'is_pre_holiday', 'is_post_holiday'
+    ]:
+        df[col] = calendar[col]
     df['lag_1h'] = df.groupby('location_id')['trips_count'].shift(1).fillna(0)
     df['lag_24h'] = df.groupby('location_id')['trips_count'].shift(24).fillna(0)
     df['lag_168h'] = df.groupby('location_id')['trips_count'].shift(168).fillna(0)
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-    df['dow_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
-    df['dow_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+    for col in ['hour_sin', 'hour_cos', 'dow_sin', 'dow_cos']:
+        df[col] = calendar[col]
     roll = df.groupby('location_id')['trips_count'].rolling(168, min_periods=1)
     df['roll_168h_mean'] = roll.mean().reset_index(level=0, drop=True)
     df['roll_168h_median'] = roll.median().reset_index(level=0, drop=True)
@@ -150,7 +128,10 @@ def merge_weather_file(input_path: str) -> str:
     start = datetime(2024, 1, 1)
     end = datetime(2025, 5, 1)
     station_id = Stations().nearby(40.7128, -74.0060).fetch(1).index[0]
-    weather = Hourly(station_id, start, end).fetch().reset_index()
+    weather = Hourly(station_id, start, end).fetch()
+    os.makedirs(os.path.dirname(WEATHER_FILE), exist_ok=True)
+    WeatherManager.save(weather, WEATHER_FILE)
+    weather = weather.reset_index()
 
     weather['date'] = weather['time'].dt.date
     weather['hour'] = weather['time'].dt.hour.astype(int)
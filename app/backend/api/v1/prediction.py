@@ -1,12 +1,21 @@
-from datetime import datetime
+import logging
+import os
+from typing import Callable, Optional
 
 from api.v1.schemas.prediction import (HistoryRequest, NYCPredictionRequest,
                                        PredictionHistoryResponse,
                                        PredictionResponse)
+from db.db import get_async_session
+from db.models.prediction import Prediction
 from fastapi import APIRouter, Body, Depends, HTTPException, status
-from services.core.security import get_current_user
+from services.core.security import get_current_user, get_current_user_async
+from services.forecast_manager import ForecastManager, next_hour_target
 from services.user_manager import UserManager
-from workers.publisher import publish_prediction_task
+from sqlmodel.ext.asyncio.session import AsyncSession
+from workers.async_publisher import async_task_publisher
+from workers.publisher import task_payload, task_publisher
+
+PREDICTION_API_MODE = os.getenv('PREDICTION_API_MODE', 'async')
 
 router = APIRouter(
     prefix='/api/v1/prediction',
@@ -14,50 +23,71 @@ router = APIRouter(
 )
 
 
-def create_nyc_prediction(
+def start_nyc_prediction(
     cost: int,
     district: int,
     user_manager: UserManager,
-) -> PredictionResponse:
-    user = user_manager.user
-
-    now = datetime.now()
-    next_hour = (now.hour + 1) % 24
+) -> tuple[Prediction, Optional[dict]]:
+    # Синхронная часть: готовый прогноз отдаём сразу, иначе создаём задачу и возвращаем её payload для очереди
+    # Час и дата прогноза из одного момента в UTC - так же их восстанавливает воркер из payload
+    target = next_hour_target()
+    next_hour = target.hour
     model_name = 'lstmv3'
     city_name = 'NYC'
 
+    forecast = ForecastManager(user_manager.session).get_fresh(model_name, district, target)
     try:
-        pred = publish_prediction_task(
-            user_id=user.id,
+        if forecast is not None and (cost == 0 or forecast.trip_costs):
+            return user_manager.prediction.create_from_forecast(forecast, city_name, cost, next_hour), None
+
+        pred = user_manager.prediction.create_prediction(
             model=model_name,
             city=city_name,
+            cost=cost,
             district=district,
             hour=next_hour,
-            cost=cost,
         )
     except PermissionError as e:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return pred, task_payload(pred, user_manager.user.status)
+
+
+async def submit_nyc_prediction(
+    session: AsyncSession,
+    prepare: Callable[[], tuple[Prediction, Optional[dict]]],
+) -> Prediction:
+    pred, payload = await session.run_sync(lambda _: prepare())
+    if payload is None:
+        return pred
+    try:
+        await async_task_publisher.publish(payload)
     except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail='Не удалось создать или отправить задачу'
-        )
+        _publish_failed(pred)
+    return pred
+
 
+def publish_nyc_prediction(pred: Prediction, payload: Optional[dict]) -> Prediction:
+    # Синхронный вариант submit_nyc_prediction: публикация через пул каналов task_publisher
+    if payload is None:
+        return pred
+    try:
+        task_publisher.publish(payload)
+    except Exception:
+        _publish_failed(pred)
     return pred
 
 
-@router.post(
-    '/nyc_free',
-    response_model=PredictionResponse,
-    status_code=status.HTTP_201_CREATED,
-    summary='Отправить запрос на предсказание',
-)
-def create_nyc_prediction_free(
-    req: NYCPredictionRequest,
-    user_manager: UserManager = Depends(get_current_user),
-) -> PredictionResponse:
+def _publish_failed(pred: Prediction) -> None:
+    logging.exception(f'Не удалось отправить задачу {pred.id} в очередь')
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail='Не удалось создать или отправить задачу'
+    )
+
+
+def prepare_free_prediction(district: int, user_manager: UserManager) -> tuple[Prediction, Optional[dict]]:
     try:
         user_manager.prediction.check_status()
     except PermissionError:
@@ -65,18 +95,10 @@ def create_nyc_prediction_free(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail='Исчерпан лимит на количество предсказаний'
         )
-    return create_nyc_prediction(0, req.district, user_manager)
+    return start_nyc_prediction(0, district, user_manager)
 
-@router.post(
-    '/nyc_cost',
-    response_model=PredictionResponse,
-    status_code=status.HTTP_201_CREATED,
-    summary='Отправить платный запрос на предсказание',
-)
-def create_nyc_prediction_cost(
-    req: NYCPredictionRequest,
-    user_manager: UserManager = Depends(get_current_user),
-) -> PredictionResponse:
+
+def prepare_cost_prediction(district: int, user_manager: UserManager) -> tuple[Prediction, Optional[dict]]:
     cost = user_manager.prediction.get_cost()
     try:
         user_manager.prediction.check_balance(cost)
@@ -85,7 +107,57 @@ def create_nyc_prediction_cost(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail='Недостаточно средств для выполнения операции'
         )
-    return create_nyc_prediction(cost, req.district, user_manager)
+    return start_nyc_prediction(cost, district, user_manager)
+
+
+async def create_nyc_prediction_free(
+    req: NYCPredictionRequest,
+    user_manager: UserManager = Depends(get_current_user_async),
+    session: AsyncSession = Depends(get_async_session),
+) -> PredictionResponse:
+    return await submit_nyc_prediction(session, lambda: prepare_free_prediction(req.district, user_manager))
+
+
+async def create_nyc_prediction_cost(
+    req: NYCPredictionRequest,
+    user_manager: UserManager = Depends(get_current_user_async),
+    session: AsyncSession = Depends(get_async_session),
+) -> PredictionResponse:
+    return await submit_nyc_prediction(session, lambda: prepare_cost_prediction(req.district, user_manager))
+
+
+def create_nyc_prediction_free_sync(
+    req: NYCPredictionRequest,
+    user_manager: UserManager = Depends(get_current_user),
+) -> PredictionResponse:
+    return publish_nyc_prediction(*prepare_free_prediction(req.district, user_manager))
+
+
+def create_nyc_prediction_cost_sync(
+    req: NYCPredictionRequest,
+    user_manager: UserManager = Depends(get_current_user),
+) -> PredictionResponse:
+    return publish_nyc_prediction(*prepare_cost_prediction(req.district, user_manager))
+
+
+# PREDICTION_API_MODE=sync возвращает прежние обработчики в threadpool FastAPI с синхронной сессией и task_publisher
+_sync = PREDICTION_API_MODE == 'sync'
+router.add_api_route(
+    '/nyc_free',
+    create_nyc_prediction_free_sync if _sync else create_nyc_prediction_free,
+    methods=['POST'],
+    response_model=PredictionResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary='Отправить запрос на предсказание',
+)
+router.add_api_route(
+    '/nyc_cost',
+    create_nyc_prediction_cost_sync if _sync else create_nyc_prediction_cost,
+    methods=['POST'],
+    response_model=PredictionResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary='Отправить платный запрос на предсказание',
+)
 
 @router.post(
     '/history',
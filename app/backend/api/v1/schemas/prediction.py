@@ -14,6 +14,7 @@ class PredictionResponse(BaseModel):
     status: str
     result: Optional[str]
     trip_costs: Optional[str]
+    model_version: Optional[str] = None
     timestamp: datetime
 
     model_config = ConfigDict(from_attributes=True)
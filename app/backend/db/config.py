@@ -15,6 +15,10 @@ class Settings(BaseSettings):
     def DATABASE_URL_psycopg(self) -> str:
         return f'postgresql+psycopg2://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}'
 
+    @property
+    def DATABASE_URL_asyncpg(self) -> str:
+        return f'postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}'
+
     model_config = SettingsConfigDict()
 
 
@@ -1,7 +1,11 @@
-from typing import Generator
+import os
+from typing import AsyncGenerator, Generator
 
 from db.config import get_settings
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 settings = get_settings()
 
@@ -12,6 +16,12 @@ engine = create_engine(
     max_overflow=10
 )
 
+async_engine = create_async_engine(
+    url=settings.DATABASE_URL_asyncpg,
+    pool_size=int(os.getenv('DB_ASYNC_POOL_SIZE', 20)),
+    max_overflow=int(os.getenv('DB_ASYNC_MAX_OVERFLOW', 20)),
+)
+
 
 def get_session() -> Generator[Session, None, None]:
     db = Session(engine)
@@ -25,5 +35,25 @@ def get_session() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    # expire_on_commit=False: после commit объекты отдаются в ответ без повторной загрузки из БД
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise e
+
+
+# create_all не добавляет столбцы в уже существующие таблицы
+MIGRATIONS = [
+    'ALTER TABLE prediction ADD COLUMN IF NOT EXISTS model_version VARCHAR',
+]
+
+
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for statement in MIGRATIONS:
+            connection.execute(text(statement))
@@ -0,0 +1,14 @@
+from datetime import UTC, datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class Forecast(SQLModel, table=True):
+    model: str = Field(primary_key=True)
+    district: int = Field(primary_key=True)
+    target: datetime = Field(primary_key=True)
+    model_version: Optional[str] = Field(default=None)
+    result: str
+    trip_costs: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
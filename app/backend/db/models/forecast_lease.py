@@ -0,0 +1,14 @@
+from datetime import UTC, datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class ForecastLease(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    owner: str
+    status: str = Field(default='running')
+    result: Optional[str] = Field(default=None)
+    trip_costs: Optional[str] = Field(default=None)
+    expires_at: datetime
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
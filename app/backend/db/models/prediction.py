@@ -13,6 +13,7 @@ class Prediction(SQLModel, table=True):
     district: Optional[int] = Field(default=None)
     result: Optional[str] = Field(default=None)
     trip_costs: Optional[str] = Field(default=None)
+    model_version: Optional[str] = Field(default=None)
     status: str = Field(default='pending')
     cost: float
     timestamp: datetime = Field(default_factory=lambda: datetime.now(UTC))
@@ -11,6 +11,8 @@ from db.db import get_session, init_db
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from services.user_manager import UserManager
+from workers.async_publisher import async_task_publisher
+from workers.publisher import task_publisher
 
 
 @asynccontextmanager
@@ -22,6 +24,9 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
 
     yield
 
+    await async_task_publisher.close()
+    task_publisher.close()
+
 app = FastAPI(
     title='OpenTaxiForecast API',
     version='0.1.0',
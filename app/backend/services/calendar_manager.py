@@ -0,0 +1,101 @@
+import os
+import threading
+from typing import NamedTuple, Optional, Union
+
+import holidays
+import numpy as np
+import pandas as pd
+
+CALENDAR_START_YEAR = int(os.getenv('CALENDAR_START_YEAR', 2020))
+CALENDAR_END_YEAR = int(os.getenv('CALENDAR_END_YEAR', 2030))
+NON_WORKING = {
+    "New Year's Day", 'MLK Day', "Washington's Birthday", 'Memorial Day',
+    'Juneteenth', 'Independence Day', 'Labor Day', 'Thanksgiving', 'Christmas Day'
+}
+DAY_COLUMNS = [
+    'day_of_week', 'month', 'is_weekend', 'is_holiday', 'is_month_start', 'is_month_end',
+    'day_of_year', 'week_of_year', 'is_pre_holiday', 'is_post_holiday', 'dow_sin', 'dow_cos'
+]
+HOUR_COLUMNS = ['hour_sin', 'hour_cos']
+
+Dates = Union[pd.Series, pd.DatetimeIndex]
+
+
+class CalendarTables(NamedTuple):
+    start: np.datetime64
+    years: tuple[int, int]
+    days: dict[str, np.ndarray]
+    hours: dict[str, np.ndarray]
+
+
+class CalendarManager:
+    # Читатели берут таблицы из неизменяемого снимка без блокировки; расширение диапазона лет
+    # строит новый снимок под _lock и подменяет его целиком
+    _lock = threading.Lock()
+    _tables: Optional[CalendarTables] = None
+
+    @classmethod
+    def build(cls, start_year: int = CALENDAR_START_YEAR, end_year: int = CALENDAR_END_YEAR) -> CalendarTables:
+        days = pd.date_range(f'{start_year}-01-01', f'{end_year}-12-31', freq='D')
+        us_holidays = holidays.US(years=range(start_year - 1, end_year + 2))
+        around = pd.date_range(days[0] - pd.Timedelta(days=1), days[-1] + pd.Timedelta(days=1), freq='D')
+        is_holiday = np.array([us_holidays.get(d) in NON_WORKING for d in around.date], dtype=np.int8)
+
+        day_of_week = days.dayofweek.to_numpy()
+        day_tables = {
+            'day_of_week': day_of_week.astype(np.int8),
+            'month': days.month.to_numpy().astype(np.int8),
+            'is_weekend': (day_of_week >= 5).astype(np.int8),
+            'is_holiday': is_holiday[1:-1],
+            'is_month_start': days.is_month_start.astype(np.int8),
+            'is_month_end': days.is_month_end.astype(np.int8),
+            'day_of_year': days.dayofyear.to_numpy().astype(np.int16),
+            'week_of_year': days.isocalendar().week.to_numpy().astype(np.int8),
+            'is_pre_holiday': is_holiday[2:],
+            'is_post_holiday': is_holiday[:-2],
+            'dow_sin': np.sin(2 * np.pi * day_of_week / 7),
+            'dow_cos': np.cos(2 * np.pi * day_of_week / 7),
+        }
+        hour = np.arange(24)
+        hour_tables = {
+            'hour_sin': np.sin(2 * np.pi * hour / 24),
+            'hour_cos': np.cos(2 * np.pi * hour / 24),
+        }
+        tables = CalendarTables(
+            start=days[0].to_datetime64().astype('datetime64[D]'),
+            years=(start_year, end_year),
+            days=day_tables,
+            hours=hour_tables,
+        )
+        cls._tables = tables
+        return tables
+
+    @classmethod
+    def _day_index(cls, dates: Dates) -> tuple[CalendarTables, np.ndarray]:
+        days = np.asarray(dates, dtype='datetime64[D]')
+        years = days.astype('datetime64[Y]').astype(int) + 1970
+        tables = cls._tables
+        if tables is None or not cls._covers(tables, years):
+            with cls._lock:
+                tables = cls._tables
+                if tables is None:
+                    tables = cls.build()
+                if not cls._covers(tables, years):
+                    start_year, end_year = tables.years
+                    tables = cls.build(min(int(years.min()), start_year), max(int(years.max()), end_year))
+        return tables, (days - tables.start).astype(np.int64)
+
+    @staticmethod
+    def _covers(tables: CalendarTables, years: np.ndarray) -> bool:
+        start_year, end_year = tables.years
+        return int(years.min(initial=start_year)) >= start_year and int(years.max(initial=end_year)) <= end_year
+
+    @classmethod
+    def features(cls, dates: Dates, hours: Optional[Union[pd.Series, np.ndarray]] = None) -> pd.DataFrame:
+        tables, idx = cls._day_index(dates)
+        columns = {name: values[idx] for name, values in tables.days.items()}
+        if hours is not None:
+            hour_idx = np.asarray(hours, dtype=np.int64)
+            columns.update({name: values[hour_idx] for name, values in tables.hours.items()})
+        index = dates.index if isinstance(dates, pd.Series) else None
+        return pd.DataFrame(columns, index=index)
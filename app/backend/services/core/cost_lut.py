@@ -0,0 +1,137 @@
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from services.calendar_manager import CalendarManager
+from services.core.numpy_mlp import CompiledMLP
+from services.weather_manager import WeatherManager
+
+COST_LUT_TRIPS_MAX = float(os.getenv('COST_LUT_TRIPS_MAX', 1500))
+COST_LUT_KNOTS = int(os.getenv('COST_LUT_KNOTS', 12))
+COST_LUT_INTERPOLATE = os.getenv('COST_LUT_INTERPOLATE', '1') == '1'
+
+
+def _hour_features(compiled: CompiledMLP, year: int) -> np.ndarray:
+    hours = pd.date_range(f'{year}-01-01', f'{year}-12-31 23:00', freq='h')
+    rows = CalendarManager.features(hours, hours.hour)
+    rows['hour'] = hours.hour
+    rows['trips_count'] = 0
+    weather = WeatherManager.lookup(hours)
+    for column in ('temp', 'prcp', 'wspd'):
+        rows[column] = weather[column].to_numpy()
+    return rows[compiled.columns[1:]].to_numpy(dtype=np.float32)
+
+
+class CostLUT:
+    # Календарь и погода однозначно задаются часом года, поэтому таблица точна по всем признакам, кроме trips_count:
+    # по нему значения берутся в узлах квадратичной сетки (гуще у нуля) и линейно интерполируются
+    def __init__(self, table: np.ndarray, districts: np.ndarray, year: int, knots: np.ndarray,
+                 report: Optional[dict] = None):
+        self.table = table
+        self.districts = districts
+        self.year = year
+        self.knots = knots
+        self.report = report or {}
+        self._start = np.datetime64(f'{year}-01-01T00', 'h').astype(np.int64)
+
+    @staticmethod
+    def build(compiled: CompiledMLP, year: int, trips_max: float = COST_LUT_TRIPS_MAX,
+              knots: int = COST_LUT_KNOTS) -> 'CostLUT':
+        hour_features = _hour_features(compiled, year)
+        trips = (np.linspace(0, np.sqrt(trips_max), knots) ** 2).astype(np.float32)
+        districts = np.append(compiled.categories, -1)
+        trips_col = compiled.columns.index('trips_count')
+
+        features = np.empty((len(hour_features), knots, len(compiled.columns)), dtype=np.float32)
+        features[:, :, 1:] = hour_features[:, None, :]
+        features[:, :, trips_col] = trips
+        features = features.reshape(-1, len(compiled.columns))
+
+        table = np.empty((len(districts), len(hour_features), knots), dtype=np.float16)
+        for i, district in enumerate(districts):
+            features[:, 0] = district
+            table[i] = np.clip(compiled(features), 0, None).reshape(len(hour_features), knots)
+        return CostLUT(table, districts, year, trips)
+
+    def evaluate(self, compiled: CompiledMLP, samples: int = 100000, seed: int = 0) -> dict:
+        rng = np.random.default_rng(seed)
+        hour_features = _hour_features(compiled, self.year)
+        district_idx = rng.integers(0, len(self.districts) - 1, samples)
+        hour_idx = rng.integers(0, len(hour_features), samples)
+        trips = np.round(rng.uniform(0, np.sqrt(self.knots[-1]), samples) ** 2).astype(np.float32)
+
+        features = np.empty((samples, len(compiled.columns)), dtype=np.float32)
+        features[:, 0] = self.districts[district_idx]
+        features[:, 1:] = hour_features[hour_idx]
+        features[:, compiled.columns.index('trips_count')] = trips
+        exact = np.round(np.clip(compiled(features), 0, None), 2)
+
+        report = {'samples': samples}
+        for mode, interpolate in (('interpolated', True), ('nearest', False)):
+            approx = np.round(self._at(district_idx, hour_idx, trips, interpolate), 2)
+            error = np.abs(approx - exact)
+            report[mode] = {
+                'max_abs_error': round(float(error.max()), 4),
+                'mean_abs_error': round(float(error.mean()), 4),
+                'mean_rel_error': round(float((error / np.maximum(exact, 0.01)).mean()), 4),
+            }
+        self.report = report
+        return report
+
+    def save(self, path: str, source: Optional[str] = None) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'table.npy'), self.table)
+        meta = {
+            'year': self.year,
+            'districts': self.districts.tolist(),
+            'knots': self.knots.tolist(),
+            'report': self.report,
+            'source': source,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    @staticmethod
+    def stored_source(path: str) -> Optional[str]:
+        # Контрольная сумма модели и препроцессора, по которым построена таблица
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                return json.load(f).get('source')
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def load(path: str) -> 'CostLUT':
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return CostLUT(
+            table=np.load(os.path.join(path, 'table.npy'), mmap_mode='r'),
+            districts=np.asarray(meta['districts'], dtype=np.float64),
+            year=meta['year'],
+            knots=np.asarray(meta['knots'], dtype=np.float32),
+            report=meta.get('report'),
+        )
+
+    def lookup(self, location_id: int, start_time: datetime, trips: list[int],
+               interpolate: bool = COST_LUT_INTERPOLATE) -> Optional[np.ndarray]:
+        hour_idx = np.datetime64(start_time, 'h').astype(np.int64) - self._start + np.arange(len(trips))
+        if hour_idx[0] < 0 or hour_idx[-1] >= self.table.shape[1]:
+            return None
+        district_idx = np.flatnonzero(self.districts[:-1] == location_id)
+        district_idx = int(district_idx[0]) if len(district_idx) else len(self.districts) - 1
+        return self._at(np.full(len(trips), district_idx), hour_idx, np.asarray(trips, dtype=np.float32), interpolate)
+
+    def _at(self, district_idx: np.ndarray, hour_idx: np.ndarray, trips: np.ndarray, interpolate: bool) -> np.ndarray:
+        trips = np.clip(trips, 0, self.knots[-1])
+        if not interpolate:
+            nearest = np.abs(self.knots[None, :] - trips[:, None]).argmin(axis=1)
+            return self.table[district_idx, hour_idx, nearest].astype(np.float32)
+        upper = np.searchsorted(self.knots, trips).clip(1, len(self.knots) - 1)
+        lower = upper - 1
+        weight = (trips - self.knots[lower]) / (self.knots[upper] - self.knots[lower])
+        low = self.table[district_idx, hour_idx, lower].astype(np.float32)
+        high = self.table[district_idx, hour_idx, upper].astype(np.float32)
+        return low * (1 - weight) + high * weight
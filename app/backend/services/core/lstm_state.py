@@ -0,0 +1,121 @@
+import os
+import threading
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import numpy as np
+from services.core.numpy_lstm import LSTMState, NumpyGraph
+from services.data_manager import DataManager
+
+LSTM_STATE_RESYNC_STEPS = int(os.getenv('LSTM_STATE_RESYNC_STEPS', 24))
+
+
+class DistrictState(NamedTuple):
+    end: int
+    steps: int
+    state: LSTMState
+    output: np.ndarray
+
+
+class IncrementalLSTM:
+    # Окна соседних часов одного района совпадают на 71 шаг из 72: вместо пересчёта всего окна продолжаем
+    # состояние LSTM с прошлого часа новыми строками. Состояние тянет за собой историю старше окна, поэтому
+    # раз в resync_steps шагов район пересчитывается по полному окну заново.
+    # graph - fused-граф: на входе сырые признаки, на выходе прогноз в поездках
+    def __init__(self, graph: NumpyGraph, resync_steps: int = LSTM_STATE_RESYNC_STEPS, past_steps: int = 72):
+        self.graph = graph
+        self.resync_steps = resync_steps
+        self.past_steps = past_steps
+        self.states: dict[int, DistrictState] = {}
+        self.data_version: Optional[str] = None
+        self.stats = {'full': 0, 'advanced': 0, 'reused': 0}
+        self._lock = threading.Lock()
+
+    def forecast(
+            self, target_datetime: datetime, district_ids: Optional[list[int]] = None,
+    ) -> tuple[list[int], np.ndarray]:
+        with self._lock:
+            index = DataManager.current_index()
+            if index.version != self.data_version:
+                self.states.clear()
+                self.data_version = index.version
+            if district_ids is None:
+                district_ids = sorted(index.offsets)
+
+            target = np.datetime64(target_datetime, 'h').astype(np.int64)
+            ends: dict[int, int] = {}
+            for district_id in district_ids:
+                span = index.offsets.get(district_id)
+                if span is None:
+                    continue
+                start, end = span
+                available = int(np.searchsorted(index.ts[start:end], target, side='right'))
+                if available:
+                    ends[district_id] = start + available
+
+            full, advance = [], {}
+            for district_id, end in ends.items():
+                cached = self.states.get(district_id)
+                if cached is not None and cached.end == end:
+                    self.stats['reused'] += 1
+                    continue
+                steps = end - cached.end if cached is not None else 0
+                if cached is not None and 0 < steps and cached.steps + steps <= self.resync_steps:
+                    advance.setdefault(steps, []).append(district_id)
+                else:
+                    full.append(district_id)
+
+            if full:
+                ids, windows = DataManager.create_sequences(
+                    target_datetime, district_ids=full, past_steps=self.past_steps
+                )
+                output, state = self.graph.run(windows)
+                self._store(ids, [ends[d] for d in ids], [0] * len(ids), state, output)
+                self.stats['full'] += len(ids)
+            for steps, ids in advance.items():
+                rows = np.array([ends[d] for d in ids])[:, None] - steps + np.arange(steps)
+                previous = [self.states[d] for d in ids]
+                state = {
+                    name: tuple(np.stack([p.state[name][i] for p in previous]) for i in range(2))
+                    for name in previous[0].state
+                }
+                output, state = self.graph.run(index.features[rows], state)
+                self._store(ids, [ends[d] for d in ids], [p.steps + steps for p in previous], state, output)
+                self.stats['advanced'] += len(ids)
+
+            ids = list(ends)
+            if not ids:
+                return [], np.empty((0,), dtype=np.float32)
+            return ids, np.stack([self.states[d].output for d in ids])
+
+    def _store(self, ids: list[int], ends: list[int], steps: list[int], state: LSTMState, output: np.ndarray) -> None:
+        for i, district_id in enumerate(ids):
+            self.states[district_id] = DistrictState(
+                end=ends[i],
+                steps=steps[i],
+                state={name: (h[i].copy(), c[i].copy()) for name, (h, c) in state.items()},
+                output=output[i].copy(),
+            )
+
+    def validate(
+            self, target_datetime: datetime, district_ids: Optional[list[int]] = None,
+    ) -> tuple[list[int], np.ndarray, dict]:
+        ids, incremental = self.forecast(target_datetime, district_ids)
+        if not ids:
+            return ids, incremental, {'districts': 0}
+        _, windows = DataManager.create_sequences(target_datetime, district_ids=ids, past_steps=self.past_steps)
+        expected = self.graph(windows)
+        diff = np.abs(incremental - expected)
+        trips_diff = np.abs(_to_trips(incremental) - _to_trips(expected))
+        report = {
+            'districts': len(ids),
+            'max_abs_diff': round(float(diff.max()), 4),
+            'mean_abs_diff': round(float(diff.mean()), 4),
+            'max_trips_diff': int(trips_diff.max()),
+            'mismatched_share': round(float((trips_diff > 0).mean()), 4),
+        }
+        return ids, expected, report
+
+
+def _to_trips(output: np.ndarray) -> np.ndarray:
+    return np.ceil(np.clip(output, 0, None)).astype(int)
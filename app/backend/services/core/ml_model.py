@@ -1,13 +1,25 @@
+import hashlib
+import logging
 import os
 import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Type
+from datetime import datetime
+from typing import Callable, Optional, Type, Union
 
 import joblib
 import numpy as np
 import pandas as pd
 from joblib import load
-from tensorflow.keras.models import load_model
+from services.core.numpy_lstm import NumpyGraph, export_keras, fuse_scalers, stored_source
+from services.core.cost_lut import CostLUT
+from services.core.numpy_mlp import CompiledMLP
+from services.data_manager import DataManager
+
+LSTM_RUNTIME = os.getenv('LSTM_RUNTIME', 'fused')
+MLP_RUNTIME = os.getenv('MLP_RUNTIME', 'numpy')
+MODEL_MEMORY_BUDGET_MB = float(os.getenv('MODEL_MEMORY_BUDGET_MB', 0))
+PINNED_MODELS = [m for m in os.getenv('PINNED_MODELS', 'lstmv3,mlp').split(',') if m]
 
 
 class MLModel(ABC):
@@ -15,6 +27,11 @@ class MLModel(ABC):
         self.model = model
         self.scaler_X = scaler_X
         self.scaler_y = scaler_y
+        self.version: Optional[str] = None
+
+    @staticmethod
+    def artifacts(model_path: str) -> list[str]:
+        return [model_path]
 
     @abstractmethod
     def predict(self, *args, **kwargs):
@@ -23,17 +40,107 @@ class MLModel(ABC):
 
 class LSTM(MLModel):
     def __init__(self, model_path: str):
+        from tensorflow.keras.models import load_model
+
         model = load_model(model_path)
         path = os.path.dirname(model_path)
         scaler_X = load(os.path.join(path, 'scaler_X.joblib'))
         scaler_y = load(os.path.join(path, 'scaler_y.joblib'))
         super().__init__(model, scaler_X, scaler_y)
 
+    @staticmethod
+    def artifacts(model_path: str) -> list[str]:
+        path = os.path.dirname(model_path)
+        return [model_path, os.path.join(path, 'scaler_X.joblib'), os.path.join(path, 'scaler_y.joblib')]
+
     def predict(self, sequence: np.ndarray) -> np.ndarray:
         batch = sequence[np.newaxis, ...]
-        y_pred = self.model.predict(batch)
+        y_pred = self.predict_batch(batch)
         return np.squeeze(y_pred, axis=0)
 
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self.model.predict(batch, batch_size=len(batch), verbose=0)
+
+    def predict_trips(self, raw_batch: np.ndarray) -> np.ndarray:
+        shape = raw_batch.shape
+        batch = self.scaler_X.transform(raw_batch.reshape(-1, shape[-1])).reshape(shape)
+        y = self.predict_batch(batch)
+        y = self.scaler_y.inverse_transform(y.reshape(-1, 1)).reshape(y.shape)
+        return np.ceil(np.clip(y, 0, None)).astype(int)
+
+
+def _fingerprint(paths: list[str]) -> tuple:
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stats.append((path, None, None))
+    return tuple(stats)
+
+
+def _checksum(paths: list[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def _runtime_path(model_path: str) -> str:
+    # Производные файлы сверяются с исходниками по контрольной сумме, записанной при сборке:
+    # mtime после git checkout или COPY в образ не говорит, какой файл новее
+    runtime_path = os.path.splitext(model_path)[0] + '.npz'
+    source = _checksum([model_path])
+    if stored_source(runtime_path) != source:
+        export_keras(model_path, runtime_path, source)
+    return runtime_path
+
+
+class NumpyLSTM(LSTM):
+    def __init__(self, model_path: str):
+        path = os.path.dirname(model_path)
+        scaler_X = load(os.path.join(path, 'scaler_X.joblib'))
+        scaler_y = load(os.path.join(path, 'scaler_y.joblib'))
+        MLModel.__init__(self, NumpyGraph(_runtime_path(model_path)), scaler_X, scaler_y)
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self.model(batch)
+
+
+class FusedLSTM(NumpyLSTM):
+    def __init__(self, model_path: str):
+        path = os.path.dirname(model_path)
+        scaler_paths = [os.path.join(path, 'scaler_X.joblib'), os.path.join(path, 'scaler_y.joblib')]
+        scaler_X, scaler_y = (load(p) for p in scaler_paths)
+
+        runtime_path = _runtime_path(model_path)
+        fused_path = os.path.splitext(model_path)[0] + '_fused.npz'
+        source = _checksum(LSTM.artifacts(model_path))
+        if stored_source(fused_path) != source:
+            fuse_scalers(runtime_path, scaler_X, scaler_y, fused_path, source)
+        MLModel.__init__(self, NumpyGraph(fused_path), scaler_X, scaler_y)
+
+    def predict_batch(self, raw_batch: np.ndarray) -> np.ndarray:
+        return self.model(raw_batch)
+
+    def predict_trips(self, raw_batch: np.ndarray) -> np.ndarray:
+        return np.ceil(np.clip(self.model(raw_batch), 0, None)).astype(int)
+
+
 class MLP(MLModel):
     def __init__(self, model_path: str):
         model = joblib.load(model_path)
@@ -41,36 +148,200 @@ class MLP(MLModel):
         scaler_X = joblib.load(os.path.join(path, 'preprocessor.joblib'))
         super().__init__(model, scaler_X, None)
 
+    @staticmethod
+    def artifacts(model_path: str) -> list[str]:
+        return [model_path, os.path.join(os.path.dirname(model_path), 'preprocessor.joblib')]
+
     def predict(self, seq: pd.DataFrame) -> float:
+        return self.predict_batch(seq)[0]
+
+    def predict_batch(self, seq: pd.DataFrame) -> list[float]:
         x_val = self.scaler_X.transform(seq)
-        y_pred = float(self.model.predict(x_val))
-        return round(max(0.0, y_pred), 2)
+        y_pred = self.model.predict(x_val)
+        return [round(max(0.0, float(y)), 2) for y in y_pred]
+
+    def predict_costs(self, location_id: int, start_time: datetime, trips: list[int]) -> list[float]:
+        return self.predict_batch(DataManager.create_feature_matrix(location_id, start_time, trips))
+
+
+class NumpyMLP(MLP):
+    def __init__(self, model_path: str):
+        super().__init__(model_path)
+        self.compiled = CompiledMLP(self.scaler_X, self.model)
+
+    def predict_batch(self, seq: Union[pd.DataFrame, np.ndarray]) -> list[float]:
+        y_pred = np.clip(self.compiled(seq), 0, None)
+        return [round(float(y), 2) for y in y_pred]
+
+
+class LookupMLP(NumpyMLP):
+    def __init__(self, model_path: str):
+        super().__init__(model_path)
+        path = os.path.dirname(model_path)
+        lut_path = os.path.join(path, 'cost_lut')
+        self.lut: Optional[CostLUT] = None
+        if CostLUT.stored_source(lut_path) == _checksum(MLP.artifacts(model_path)):
+            self.lut = CostLUT.load(lut_path)
+        else:
+            logging.warning(f'Таблица стоимостей {lut_path} отсутствует или устарела, считаем стоимость моделью')
+
+    @staticmethod
+    def artifacts(model_path: str) -> list[str]:
+        return MLP.artifacts(model_path) + [os.path.join(os.path.dirname(model_path), 'cost_lut', 'meta.json')]
+
+    def predict_costs(self, location_id: int, start_time: datetime, trips: list[int]) -> list[float]:
+        costs = self.lut.lookup(location_id, start_time, trips) if self.lut is not None else None
+        if costs is None:
+            return super().predict_costs(location_id, start_time, trips)
+        return [round(float(c), 2) for c in costs]
+
+
+LSTMRuntime = {'keras': LSTM, 'numpy': NumpyLSTM}.get(LSTM_RUNTIME, FusedLSTM)
 
 registry: dict[str, tuple[Type[MLModel], str]] = {
-    'lstm': (LSTM, 'lstm_v1'),
-    'lstmv3': (LSTM, 'lstm_v3'),
-    'mlp': (MLP,  'mlp_v1'),
+    'lstm': (LSTMRuntime, 'lstm_v1'),
+    'lstmv3': (LSTMRuntime, 'lstm_v3'),
+    'mlp': ({'sklearn': MLP, 'lut': LookupMLP}.get(MLP_RUNTIME, NumpyMLP), 'mlp_v1'),
 }
 
+
 class ModelRegistry:
+    # Читатели берут модели из неизменяемого снимка без блокировки; _lock только упорядочивает загрузки,
+    # новые экземпляры собираются в стороне и подменяют снимок целиком
     _lock = threading.Lock()
-    _instances: dict[str, object] = {}
+    _snapshot: dict[str, MLModel] = {}
+    _fingerprints: dict[str, tuple] = {}
+    _footprints: dict[str, int] = {}
+    _last_used: dict[str, float] = {}
+    _reload_listeners: list[Callable[[], None]] = []
 
     @classmethod
-    def get(cls, name: str):
+    def get(cls, name: str) -> MLModel:
+        cls._last_used[name] = time.monotonic()
+        instance = cls._snapshot.get(name)
+        if instance is not None:
+            return instance
         with cls._lock:
-            if name not in cls._instances:
-                ModelClass, path_name = registry[name]
-                path = cls._model_path(name, path_name)
-                cls._instances[name] = ModelClass(path)
-            return cls._instances[name]
+            instance = cls._snapshot.get(name)
+            if instance is None:
+                cls._fingerprints[name] = cls._fingerprint(name)
+                instance = cls._load(name)
+                cls._snapshot = {**cls._snapshot, name: instance}
+                cls._evict(keep={name})
+            return instance
+
+    @classmethod
+    def warm_up(cls, names: Optional[list[str]] = None) -> list[str]:
+        names = [name for name in (names or PINNED_MODELS) if name in registry]
+        for name in names:
+            cls.get(name)
+        return names
 
     @classmethod
-    def reload_all(cls):
+    def reload_all(cls) -> list[str]:
+        return cls.reload(list(registry), force=True)
+
+    @classmethod
+    def reload_changed(cls) -> list[str]:
+        return cls.reload(list(cls._snapshot))
+
+    @classmethod
+    def reload(cls, names: list[str], force: bool = False) -> list[str]:
+        fresh: dict[str, MLModel] = {}
         with cls._lock:
-            for name, (ModelClass, path_name) in registry.items():
-                path = cls._model_path(name, path_name)
-                cls._instances[name] = ModelClass(path)
+            snapshot = cls._snapshot
+            for name in names:
+                fingerprint = cls._fingerprint(name)
+                if not force and cls._fingerprints.get(name) == fingerprint:
+                    continue
+                cls._fingerprints[name] = fingerprint
+                current = snapshot.get(name)
+                if not force and current is not None and current.version == cls._version(name):
+                    continue
+                try:
+                    fresh[name] = cls._load(name)
+                except Exception as e:
+                    if force:
+                        raise
+                    logging.exception(f'Не удалось перезагрузить модель {name}, остаётся прежняя версия: {e}')
+            if fresh:
+                cls._snapshot = {**snapshot, **fresh}
+                cls._evict(keep=set(fresh))
+        if fresh:
+            for listener in cls._reload_listeners:
+                listener()
+        return list(fresh)
+
+    @classmethod
+    def stats(cls) -> dict[str, dict]:
+        now = time.monotonic()
+        return {
+            name: {
+                'version': instance.version,
+                'memory_mb': round(cls._footprints.get(name, 0) / 2 ** 20, 1),
+                'pinned': name in PINNED_MODELS,
+                'idle_seconds': round(now - cls._last_used.get(name, now)),
+            }
+            for name, instance in cls._snapshot.items()
+        }
+
+    @classmethod
+    def _evict(cls, keep: set[str]) -> list[str]:
+        # Вызывается под _lock. Выгруженная модель остаётся у задач, которые уже её взяли, и освобождается после них
+        if not MODEL_MEMORY_BUDGET_MB:
+            return []
+        budget = MODEL_MEMORY_BUDGET_MB * 2 ** 20
+        snapshot = dict(cls._snapshot)
+        candidates = sorted(
+            (name for name in snapshot if name not in PINNED_MODELS and name not in keep),
+            key=lambda name: cls._last_used.get(name, 0),
+        )
+        evicted = []
+        while candidates and sum(cls._footprints.get(name, 0) for name in snapshot) > budget:
+            name = candidates.pop(0)
+            del snapshot[name]
+            cls._fingerprints.pop(name, None)
+            cls._footprints.pop(name, None)
+            evicted.append(name)
+        if evicted:
+            cls._snapshot = snapshot
+            logging.info(f'Выгружены давно не использованные модели: {", ".join(evicted)}')
+        used = sum(cls._footprints.get(name, 0) for name in snapshot)
+        if used > budget:
+            logging.warning(
+                f'Модели занимают ~{used / 2 ** 20:.0f} МБ при бюджете {MODEL_MEMORY_BUDGET_MB:.0f} МБ, '
+                f'выгружать нечего'
+            )
+        return evicted
+
+    @classmethod
+    def on_reload(cls, listener: Callable[[], None]) -> None:
+        cls._reload_listeners.append(listener)
+
+    @classmethod
+    def _artifacts(cls, name: str) -> list[str]:
+        ModelClass, path_name = registry[name]
+        return ModelClass.artifacts(cls._model_path(name, path_name))
+
+    @classmethod
+    def _fingerprint(cls, name: str) -> tuple:
+        return _fingerprint(cls._artifacts(name))
+
+    @classmethod
+    def _version(cls, name: str) -> str:
+        return f'{registry[name][1]}-{_checksum(cls._artifacts(name))[:8]}'
+
+    @classmethod
+    def _load(cls, name: str) -> MLModel:
+        ModelClass, path_name = registry[name]
+        version = cls._version(name)
+        # Оценка занимаемой памяти: прирост RSS за время загрузки, но не меньше размера файлов модели
+        rss = _rss_bytes()
+        instance = ModelClass(cls._model_path(name, path_name))
+        instance.version = version
+        artifacts_size = sum(os.path.getsize(p) for p in cls._artifacts(name) if os.path.exists(p))
+        cls._footprints[name] = max(_rss_bytes() - rss, artifacts_size)
+        return instance
 
     @staticmethod
     def _model_path(name: str, path: str) -> str:
@@ -0,0 +1,186 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+SUPPORTED_LAYERS = {'InputLayer', 'LSTM', 'BatchNormalization', 'Dropout', 'Add', 'Dense'}
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 0.5 * (1 + np.tanh(0.5 * x)),
+}
+
+LSTMState = dict[str, tuple[np.ndarray, np.ndarray]]
+
+
+def _inbound(layer_config: dict) -> list[str]:
+    names = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            history = None
+            if node.get('class_name') == '__keras_tensor__':
+                history = node.get('config', {}).get('keras_history')
+            if history:
+                names.append(history[0])
+                return
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, (list, tuple)):
+            for value in node:
+                walk(value)
+
+    walk(layer_config.get('inbound_nodes', []))
+    return names
+
+
+def export_keras(model_path: str, out_path: str, source: str = '') -> str:
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path)
+    configs = {layer['name']: layer for layer in model.get_config()['layers']}
+    graph, arrays = [], {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError(f'Слой {layer.name} ({kind}) не поддерживается NumPy-рантаймом')
+        config = layer.get_config()
+        node = {'name': layer.name, 'type': kind, 'inputs': _inbound(configs[layer.name])}
+        if kind == 'LSTM':
+            node.update({k: config[k] for k in ('units', 'activation', 'recurrent_activation', 'return_sequences')})
+            if config.get('go_backwards') or config.get('stateful'):
+                raise ValueError(f'Слой {layer.name}: go_backwards/stateful не поддерживаются')
+        elif kind == 'BatchNormalization':
+            node['epsilon'] = config['epsilon']
+        elif kind == 'Dense':
+            node['activation'] = config['activation']
+        for i, weight in enumerate(layer.get_weights()):
+            arrays[f'{layer.name}/{i}'] = np.asarray(weight, dtype=np.float32)
+        graph.append(node)
+
+    return _save(out_path, graph, arrays, source)
+
+
+def fuse_scalers(runtime_path: str, scaler_X, scaler_y, out_path: str, source: str = '') -> str:
+    with np.load(runtime_path, allow_pickle=False) as f:
+        graph = json.loads(str(f['__graph__']))
+        arrays = {key: f[key] for key in f.files if not key.startswith('__')}
+
+    # (x - mean) / scale @ W + b == x @ (W / scale) + (b - mean / scale @ W)
+    inputs = {node['name'] for node in graph if node['type'] == 'InputLayer'}
+    mean_x, scale_x = np.asarray(scaler_X.mean_, np.float64), np.asarray(scaler_X.scale_, np.float64)
+    for node in graph:
+        if not inputs & set(node['inputs']):
+            continue
+        if node['type'] not in ('LSTM', 'Dense') or len(node['inputs']) != 1:
+            raise ValueError(f'Нельзя встроить scaler_X в слой {node["name"]} ({node["type"]})')
+        kernel_key, bias_key = f'{node["name"]}/0', f'{node["name"]}/{2 if node["type"] == "LSTM" else 1}'
+        kernel = arrays[kernel_key].astype(np.float64)
+        arrays[bias_key] = (arrays[bias_key] - (mean_x / scale_x) @ kernel).astype(np.float32)
+        arrays[kernel_key] = (kernel / scale_x[:, None]).astype(np.float32)
+
+    # y * scale + mean для линейного выходного Dense
+    output = graph[-1]
+    if output['type'] != 'Dense' or output['activation'] != 'linear':
+        raise ValueError(f'Нельзя встроить scaler_y в слой {output["name"]} ({output["type"]})')
+    mean_y, scale_y = float(scaler_y.mean_[0]), float(scaler_y.scale_[0])
+    kernel_key, bias_key = f'{output["name"]}/0', f'{output["name"]}/1'
+    arrays[kernel_key] = (arrays[kernel_key].astype(np.float64) * scale_y).astype(np.float32)
+    arrays[bias_key] = (arrays[bias_key].astype(np.float64) * scale_y + mean_y).astype(np.float32)
+
+    return _save(out_path, graph, arrays, source)
+
+
+def _save(out_path: str, graph: list[dict], arrays: dict[str, np.ndarray], source: str) -> str:
+    # __source__ - контрольная сумма исходников, из которых собран файл (см. ml_model._runtime_path, _checksum)
+    tmp_path = f'{out_path}.tmp.npz'
+    np.savez(tmp_path, __graph__=np.array(json.dumps(graph)), __source__=np.array(source), **arrays)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def stored_source(path: str) -> Optional[str]:
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            return str(f['__source__']) if '__source__' in f.files else None
+    except (OSError, ValueError):
+        return None
+
+
+class NumpyGraph:
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as f:
+            self.graph = json.loads(str(f['__graph__']))
+            weights = {key: f[key] for key in f.files if not key.startswith('__')}
+
+        self.params: dict[str, tuple] = {}
+        for node in self.graph:
+            name, kind = node['name'], node['type']
+            if kind == 'LSTM':
+                kernel, recurrent, bias = (weights[f'{name}/{i}'] for i in range(3))
+                self.params[name] = (kernel, recurrent, bias)
+            elif kind == 'BatchNormalization':
+                gamma, beta, mean, var = (weights[f'{name}/{i}'] for i in range(4))
+                scale = (gamma / np.sqrt(var + np.float32(node['epsilon']))).astype(np.float32)
+                self.params[name] = (scale, (beta - mean * scale).astype(np.float32))
+            elif kind == 'Dense':
+                self.params[name] = (weights[f'{name}/0'], weights[f'{name}/1'])
+        self.output = self.graph[-1]['name']
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.run(batch)[0]
+
+    def run(self, batch: np.ndarray, state: Optional[LSTMState] = None) -> tuple[np.ndarray, LSTMState]:
+        # state - (h, c) каждого LSTM-слоя после последнего шага,
+        # с ним можно продолжить последовательность новыми шагами
+        values: dict[str, np.ndarray] = {}
+        new_state: LSTMState = {}
+        for node in self.graph:
+            name, kind = node['name'], node['type']
+            args = [values[i] for i in node['inputs']]
+            if kind == 'InputLayer':
+                values[name] = np.asarray(batch, dtype=np.float32)
+            elif kind == 'LSTM':
+                values[name], new_state[name] = self._lstm(node, args[0], (state or {}).get(name))
+            elif kind == 'BatchNormalization':
+                scale, shift = self.params[name]
+                values[name] = args[0] * scale + shift
+            elif kind == 'Dropout':
+                values[name] = args[0]
+            elif kind == 'Add':
+                values[name] = np.sum(args, axis=0)
+            elif kind == 'Dense':
+                kernel, bias = self.params[name]
+                values[name] = ACTIVATIONS[node['activation']](args[0] @ kernel + bias)
+        return values[self.output], new_state
+
+    def _lstm(
+            self, node: dict, x: np.ndarray, state: Optional[tuple[np.ndarray, np.ndarray]] = None,
+    ) -> tuple[np.ndarray, tuple[np.ndarray, np.ndarray]]:
+        kernel, recurrent, bias = self.params[node['name']]
+        units = node['units']
+        activation = ACTIVATIONS[node['activation']]
+        recurrent_activation = ACTIVATIONS[node['recurrent_activation']]
+
+        batch_size, steps, _ = x.shape
+        # Входную проекцию считаем сразу для всех шагов, в цикле остаётся только h @ U
+        projected = (x.reshape(-1, x.shape[2]) @ kernel + bias).reshape(batch_size, steps, 4 * units)
+        if state is None:
+            h = np.zeros((batch_size, units), dtype=np.float32)
+            c = np.zeros((batch_size, units), dtype=np.float32)
+        else:
+            h, c = state
+        outputs = np.empty((batch_size, steps, units), dtype=np.float32) if node['return_sequences'] else None
+        for t in range(steps):
+            z = projected[:, t] + h @ recurrent
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            if outputs is not None:
+                outputs[:, t] = h
+        return (outputs if outputs is not None else h), (h, c)
@@ -0,0 +1,65 @@
+from typing import Union
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.neural_network import MLPRegressor
+
+ACTIVATIONS = {
+    'identity': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'logistic': lambda x: 0.5 * (1 + np.tanh(0.5 * x)),
+}
+
+
+class CompiledMLP:
+    def __init__(self, preprocessor: ColumnTransformer, model: MLPRegressor):
+        if preprocessor.remainder != 'drop' or model.n_outputs_ != 1:
+            raise ValueError('Поддерживается только ColumnTransformer без remainder и MLP с одним выходом')
+        transformers = {name: (transformer, list(columns)) for name, transformer, columns in preprocessor.transformers_}
+        encoder, (category_column,) = transformers['cat']
+        numeric, numeric_columns = transformers['num']
+        imputer, scaler = numeric.named_steps['imputer'], numeric.named_steps['scaler']
+        if encoder.handle_unknown != 'ignore' or encoder.drop_idx_ is not None or imputer.strategy != 'mean':
+            raise ValueError('Неподдерживаемые настройки препроцессора стоимости')
+
+        categories = np.asarray(encoder.categories_[0], dtype=np.float64)
+        n_categories = len(categories)
+        first = np.asarray(model.coefs_[0], dtype=np.float64)
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(len(numeric_columns))
+        scale = scaler.scale_ if scaler.with_std else np.ones(len(numeric_columns))
+
+        self.columns = [category_column] + numeric_columns
+        self.categories = categories
+        # Строка one-hot @ W1 - это просто строка W1, поэтому кодирование района сводится к выборке по индексу;
+        # последняя нулевая строка отвечает за неизвестный район (handle_unknown='ignore')
+        self.category_weights = np.vstack([first[:n_categories], np.zeros((1, first.shape[1]))]).astype(np.float32)
+        self.fill_values = np.asarray(imputer.statistics_, dtype=np.float32)
+        self.numeric_weights = (first[n_categories:] / scale[:, None]).astype(np.float32)
+        self.first_bias = (model.intercepts_[0] - (mean / scale) @ first[n_categories:]).astype(np.float32)
+        self.layers = [
+            (np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32))
+            for w, b in zip(model.coefs_[1:], model.intercepts_[1:])
+        ]
+        self.hidden_activation = ACTIVATIONS[model.activation]
+        self.out_activation = ACTIVATIONS[model.out_activation_]
+
+    def __call__(self, features: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        if isinstance(features, pd.DataFrame):
+            features = features[self.columns].to_numpy(dtype=np.float32)
+        features = np.asarray(features, dtype=np.float32)
+
+        locations = features[:, 0]
+        pos = np.searchsorted(self.categories, locations).clip(max=len(self.categories) - 1)
+        known = self.categories[pos] == locations
+        category_idx = np.where(known, pos, len(self.categories))
+
+        numeric = features[:, 1:]
+        numeric = np.where(np.isnan(numeric), self.fill_values, numeric)
+
+        x = self.category_weights[category_idx] + numeric @ self.numeric_weights + self.first_bias
+        for weights, bias in self.layers:
+            x = self.hidden_activation(x)
+            x = x @ weights + bias
+        return self.out_activation(x)[:, 0]
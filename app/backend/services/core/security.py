@@ -2,13 +2,15 @@ import os
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
-from db.db import get_session
+from db.db import get_async_session, get_session
+from db.models.user import User
 from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from services.user_manager import UserManager
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'my_key')
 ALGORITHM = 'HS256'
@@ -68,6 +70,25 @@ def get_current_user(
     session: Session = Depends(get_session),
     x_bot_secret: Optional[str] = Header(None)
 ) -> UserManager:
+    username = _token_username(token, x_bot_secret)
+    user_manager = UserManager(session)
+    return _bind_user(user_manager, user_manager.get_by_username(username))
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_async_session),
+    x_bot_secret: Optional[str] = Header(None)
+) -> UserManager:
+    # Менеджеры синхронные: внутри run_sync они работают через asyncpg без потоков из threadpool.
+    # Вызывать методы возвращённого менеджера тоже нужно через session.run_sync
+    username = _token_username(token, x_bot_secret)
+    user_manager = UserManager(session.sync_session)
+    user_obj = await session.run_sync(lambda _: user_manager.get_by_username(username))
+    return _bind_user(user_manager, user_obj)
+
+
+def _token_username(token: str, x_bot_secret: Optional[str]) -> str:
     try:
         payload = decode_token(token, verify_exp=True)
     except JWTError:
@@ -98,9 +119,10 @@ def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail='У вас нет прав на этот ресурс',
         )
+    return username
 
-    user_manager = UserManager(session)
-    user_obj = user_manager.get_by_username(username)
+
+def _bind_user(user_manager: UserManager, user_obj: Optional[User]) -> UserManager:
     if not user_obj:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
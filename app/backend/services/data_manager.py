@@ -1,20 +1,44 @@
-from datetime import datetime, timedelta
-from typing import Optional
+import json
+import mmap
+import os
+import shutil
+from datetime import UTC, datetime
+from typing import NamedTuple, Optional
 
-import holidays
 import numpy as np
 import pandas as pd
-from meteostat import Hourly, Stations
+from services.calendar_manager import CalendarManager
+from services.weather_manager import WeatherManager
 from sklearn.preprocessing import StandardScaler
 
 
+FEATURE_COLUMNS = [
+    'trips_count', 'hour_sin', 'hour_cos', 'dow_sin', 'dow_cos',
+    'is_holiday', 'month', 'is_weekend', 'is_month_start', 'is_month_end',
+    'day_of_year', 'week_of_year', 'is_pre_holiday', 'is_post_holiday',
+    'lag_1h', 'lag_24h', 'lag_168h', 'roll_168h_mean', 'roll_168h_median', 'roll_168h_std',
+    'time_idx', 'temp', 'prcp', 'wspd'
+]
+KEY_COLUMNS = ['location_id', 'date', 'hour']
+DATA_MMAP = os.getenv('DATA_MMAP', '1') == '1'
+
+
+class DistrictIndex(NamedTuple):
+    features: np.ndarray
+    ts: np.ndarray
+    offsets: dict[int, tuple[int, int]]
+    means: dict[int, np.ndarray]
+    version: Optional[str] = None
+
+
 class DataManager:
     _df: Optional[pd.DataFrame] = None
     _loaded_path: Optional[str] = None
+    _index: Optional[DistrictIndex] = None
 
     def __init__(self, path: Optional[str] = None):
         self._path: Optional[str] = path
-        self.load_csv()
+        self.load()
 
     @property
     def path(self) -> Optional[str]:
@@ -26,121 +50,233 @@ class DataManager:
             DataManager._df = None
             DataManager._loaded_path = None
             self._path = new_path
+            self.load()
+
+    @property
+    def version(self) -> Optional[str]:
+        return DataManager._index.version if DataManager._index else None
+
+    @staticmethod
+    def current_index() -> DistrictIndex:
+        # Снимок не меняется: переключение датасета подменяет его целиком, поэтому держать ссылку безопасно
+        index = DataManager._index
+        if index is None:
+            raise RuntimeError('Датасет не загружен')
+        return index
+
+    def load(self) -> None:
+        if os.path.isdir(self.path):
+            self.load_store()
+        else:
             self.load_csv()
 
+    def refresh(self) -> bool:
+        if not os.path.isdir(self.path) or os.path.realpath(self.path) == self.version:
+            return False
+        self.load_store()
+        return True
+
     def load_csv(self) -> pd.DataFrame:
         if DataManager._df is None or DataManager._loaded_path != self.path:
-            DataManager._df = pd.read_csv(self.path)
+            DataManager._df = pd.read_csv(self.path, usecols=KEY_COLUMNS + FEATURE_COLUMNS)
             DataManager._loaded_path = self.path
+            DataManager._index = DataManager._build_index(DataManager._df, version=os.path.realpath(self.path))
         return DataManager._df
 
+    def load_store(self) -> None:
+        store_path = os.path.realpath(self.path)
+        if DataManager._loaded_path == self.path and self.version == store_path:
+            return
+        with open(os.path.join(store_path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['columns'] != FEATURE_COLUMNS:
+            raise ValueError(f'Признаки в {store_path} не совпадают с ожидаемыми моделью')
+
+        mmap_mode = 'r' if DATA_MMAP else None
+        districts = np.load(os.path.join(store_path, 'districts.npy'))
+        means = np.load(os.path.join(store_path, 'means.npy'))
+        index = DistrictIndex(
+            features=np.load(os.path.join(store_path, 'features.npy'), mmap_mode=mmap_mode),
+            ts=np.load(os.path.join(store_path, 'ts.npy'), mmap_mode=mmap_mode),
+            offsets={int(d): (int(start), int(end)) for d, start, end in districts},
+            means={int(d): means[i] for i, d in enumerate(districts[:, 0])},
+            version=store_path,
+        )
+
+        DataManager._df = None
+        DataManager._index = index
+        DataManager._loaded_path = self.path
+
+    @staticmethod
+    def save_store(path: str, source: Optional[str] = None) -> None:
+        index = DataManager._index
+        os.makedirs(path, exist_ok=True)
+        district_ids = sorted(index.offsets)
+        districts = np.array([(d, *index.offsets[d]) for d in district_ids], dtype=np.int64).reshape(-1, 3)
+        means = np.array([index.means[d] for d in district_ids], dtype=np.float32).reshape(-1, len(FEATURE_COLUMNS))
+
+        np.save(os.path.join(path, 'features.npy'), np.ascontiguousarray(index.features))
+        np.save(os.path.join(path, 'ts.npy'), np.ascontiguousarray(index.ts))
+        np.save(os.path.join(path, 'districts.npy'), districts)
+        np.save(os.path.join(path, 'means.npy'), means)
+        manifest = {
+            'columns': FEATURE_COLUMNS,
+            'rows': int(len(index.ts)),
+            'districts': len(district_ids),
+            'source': source,
+            'created_at': datetime.now(UTC).isoformat(),
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    @staticmethod
+    def convert_csv(csv_path: str, store_path: str) -> None:
+        DataManager(csv_path)
+        DataManager.save_store(store_path, source=csv_path)
+
+    @staticmethod
+    def publish_store(csv_path: str, root: str, keep: int = 2) -> str:
+        os.makedirs(root, exist_ok=True)
+        version = datetime.now(UTC).strftime('%Y%m%dT%H%M%S%f')
+        building = os.path.join(root, f'.{version}.tmp')
+        DataManager.convert_csv(csv_path, building)
+        os.replace(building, os.path.join(root, version))
+
+        link = os.path.join(root, 'current')
+        tmp_link = f'{link}.tmp'
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(version, tmp_link)
+        os.replace(tmp_link, link)
+
+        versions = sorted(d for d in os.listdir(root) if not d.startswith('.') and d != 'current')
+        for old in versions[:-keep]:
+            shutil.rmtree(os.path.join(root, old))
+        return os.path.join(root, version)
+
+    @staticmethod
+    def touch() -> int:
+        # Читаем по одному значению с каждой страницы, чтобы первый запрос не ждал подкачки mmap с диска
+        index = DataManager._index
+        touched = 0
+        for array in (index.features, index.ts):
+            flat = array.reshape(-1)
+            step = max(1, mmap.PAGESIZE // array.itemsize)
+            float(flat[::step].sum())
+            touched += array.nbytes
+        return touched
+
+    @staticmethod
+    def _build_index(df: pd.DataFrame, date_col: str = 'date', hour_col: str = 'hour',
+                     version: Optional[str] = None) -> DistrictIndex:
+        days = pd.to_datetime(df[date_col]).dt.normalize().to_numpy().astype('datetime64[h]').astype(np.int64)
+        ts = days + df[hour_col].to_numpy(dtype=np.int64)
+        locations = df['location_id'].to_numpy()
+
+        order = np.lexsort((ts, locations))
+        ts = ts[order]
+        locations = locations[order]
+        features = df[FEATURE_COLUMNS].to_numpy(dtype=np.float32)[order]
+
+        bounds = np.flatnonzero(np.diff(locations)) + 1
+        offsets, means = {}, {}
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(locations)]):
+            district_id = int(locations[start])
+            block = features[start:end]
+            district_means = np.nanmean(np.asfortranarray(block), axis=0)
+            nan_mask = np.isnan(block)
+            if nan_mask.any():
+                block[nan_mask] = np.take(district_means, np.where(nan_mask)[1])
+            offsets[district_id] = (int(start), int(end))
+            means[district_id] = district_means
+
+        return DistrictIndex(features, ts, offsets, means, version)
+
     @staticmethod
     def create_single_sequence(
             target_datetime: datetime,
             district_id: int,
-            scaler_X: StandardScaler,
+            scaler_X: Optional[StandardScaler] = None,
             past_steps: int = 72,
-            date_col: str = 'date',
-            hour_col: str = 'hour'
-    ) -> tuple[np.ndarray, np.ndarray]:
-        features_cols = [
-            'trips_count', 'hour_sin', 'hour_cos', 'dow_sin', 'dow_cos',
-            'is_holiday', 'month', 'is_weekend', 'is_month_start', 'is_month_end',
-            'day_of_year', 'week_of_year', 'is_pre_holiday', 'is_post_holiday',
-            'lag_1h', 'lag_24h', 'lag_168h', 'roll_168h_mean', 'roll_168h_median', 'roll_168h_std',
-            'time_idx', 'temp', 'prcp', 'wspd'
-        ]
-
-        df = DataManager._df
-
-        sub = df[df['location_id'] == district_id].copy()
-        if sub.empty:
+    ) -> np.ndarray:
+        index = DataManager._index
+        span = index.offsets.get(district_id)
+        if span is None:
             raise ValueError(f'Нет данных для района={district_id}')
+        start, end = span
 
-        sub['__date__'] = pd.to_datetime(sub[date_col]).dt.normalize()
-        sub['ts'] = sub['__date__'] + pd.to_timedelta(sub[hour_col], unit='h')
-        sub.drop(columns=['__date__'], inplace=True)
-
-        sub = sub.sort_values('ts').reset_index(drop=True)
-
-        le_mask = sub['ts'] <= target_datetime
-        if not le_mask.any():
+        target = np.datetime64(target_datetime, 'h').astype(np.int64)
+        available = int(np.searchsorted(index.ts[start:end], target, side='right'))
+        if available == 0:
             raise ValueError(f'В районе={district_id} нет записей ≤ {target_datetime}')
-        idx = sub[le_mask].index[-1]
-
-        available = idx + 1
-
-        hist = sub.iloc[0:idx + 1].copy()
-
-        full_feats = sub[features_cols].astype('float32').to_numpy()
-        means = np.nanmean(full_feats, axis=0)
-
-        X_hist = hist[features_cols].astype('float32').to_numpy()
-
-        mask_hist_nan = np.isnan(X_hist)
-        if mask_hist_nan.any():
-            X_hist[mask_hist_nan] = np.take(means, np.where(mask_hist_nan)[1])
 
+        X_hist = index.features[start:start + available]
         if available < past_steps:
-            pad_count = past_steps - available
-
-            pad_block = np.tile(means, (pad_count, 1))
-
+            pad_block = np.tile(index.means[district_id], (past_steps - available, 1))
             X_window = np.vstack([pad_block, X_hist])
         else:
             X_window = X_hist[-past_steps:]
 
+        if scaler_X is None:
+            return X_window
         seq_scaled = scaler_X.transform(X_window)
 
         return seq_scaled
 
+    @staticmethod
+    def create_sequences(
+            target_datetime: datetime,
+            scaler_X: Optional[StandardScaler] = None,
+            district_ids: Optional[list[int]] = None,
+            past_steps: int = 72,
+    ) -> tuple[list[int], np.ndarray]:
+        index = DataManager._index
+        if district_ids is None:
+            district_ids = sorted(index.offsets)
+        district_ids = [d for d in district_ids if d in index.offsets]
+
+        target = np.datetime64(target_datetime, 'h').astype(np.int64)
+        starts = np.array([index.offsets[d][0] for d in district_ids], dtype=np.int64)
+        available = np.array([
+            np.searchsorted(index.ts[start:end], target, side='right')
+            for start, end in (index.offsets[d] for d in district_ids)
+        ], dtype=np.int64)
+        keep = available > 0
+        district_ids = [d for d, k in zip(district_ids, keep) if k]
+        starts, ends = starts[keep], starts[keep] + available[keep]
+        if not district_ids:
+            return [], np.empty((0, past_steps, index.features.shape[1]), dtype=index.features.dtype)
+
+        # Окна всех районов одним gather; недостающую историю слева добиваем средними района
+        rows = ends[:, None] - past_steps + np.arange(past_steps)
+        padded = rows < starts[:, None]
+        windows = index.features[np.where(padded, starts[:, None], rows)]
+        means = np.stack([index.means[d] for d in district_ids])
+        windows = np.where(padded[:, :, None], means[:, None, :], windows)
+
+        if scaler_X is None:
+            return district_ids, windows
+        n_features = windows.shape[2]
+        seq_scaled = scaler_X.transform(windows.reshape(-1, n_features))
+        return district_ids, seq_scaled.reshape(len(district_ids), past_steps, n_features)
+
     @staticmethod
     def create_feature_vector(location_id: int, date: datetime, hour: int, trips: int) -> pd.DataFrame:
-        us_holidays = holidays.US()
-        non_working = {
-            "New Year's Day", 'MLK Day', "Washington's Birthday", 'Memorial Day',
-            'Juneteenth', 'Independence Day', 'Labor Day', 'Thanksgiving', 'Christmas Day'
-        }
-        df = pd.DataFrame({
-            'location_id': [location_id],
-            'date': [pd.to_datetime(date)],
-            'hour': [hour],
-            'trips_count': [trips]
-        })
-
-        df['day_of_week'] = df['date'].dt.dayofweek
-        df['month'] = df['date'].dt.month
-        df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
-        df['is_holiday'] = df['date'].apply(lambda d: us_holidays.get(d.date()) in non_working)
-        df['is_month_start'] = df['date'].dt.is_month_start.astype(int)
-        df['is_month_end'] = df['date'].dt.is_month_end.astype(int)
-        df['day_of_year'] = df['date'].dt.dayofyear
-        df['week_of_year'] = df['date'].dt.isocalendar().week.astype(int)
-
-        df['is_pre_holiday'] = df['date'].apply(
-            lambda d: us_holidays.get((d + timedelta(days=1)).date()) in non_working)
-        df['is_post_holiday'] = df['date'].apply(
-            lambda d: us_holidays.get((d - timedelta(days=1)).date()) in non_working)
-
-        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-
-        station = Stations().nearby(40.7128, -74.0060).fetch(1).index[0]
-
-        start_time = pd.Timestamp(year=date.year, month=date.month, day=date.day, hour=hour)
-        end_time = start_time + timedelta(hours=1)
-
-        weather_data = Hourly(station, start_time, end_time).fetch()
-
-        if not weather_data.empty:
-            row = weather_data.iloc[0]
-            df['temp'] = row['temp'] if 'temp' in row and row['temp'] else 0
-            df['prcp'] = row['prcp'] if 'prcp' in row and row['prcp'] else 0
-            df['wspd'] = row['wspd'] if 'wspd' in row and row['wspd'] else 0
-        else:
-            df['temp'] = 0
-            df['prcp'] = 0
-            df['wspd'] = 0
+        start_time = datetime(date.year, date.month, date.day, hour)
+        return DataManager.create_feature_matrix(location_id, start_time, [trips])
+
+    @staticmethod
+    def create_feature_matrix(location_id: int, start_time: datetime, trips: list[int]) -> pd.DataFrame:
+        dates = pd.date_range(pd.Timestamp(start_time).floor('h'), periods=len(trips), freq='h')
+        df = CalendarManager.features(dates, dates.hour)
+        df['location_id'] = location_id
+        df['hour'] = dates.hour
+        df['trips_count'] = trips
+
+        weather = WeatherManager.lookup(dates)
+        df['temp'] = weather['temp'].to_numpy()
+        df['prcp'] = weather['prcp'].to_numpy()
+        df['wspd'] = weather['wspd'].to_numpy()
 
         features = [
             'location_id', 'trips_count', 'hour', 'temp', 'prcp', 'wspd',
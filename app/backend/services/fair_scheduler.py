@@ -0,0 +1,59 @@
+from collections import deque
+from typing import Generic, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+class FairScheduler(Generic[T]):
+    # Deficit round robin по ключу (user_id): в начале своего хода ключ получает quantum * weight,
+    # и из его очереди выдаются элементы, пока хватает дефицита. Пользователь с сотней задач в буфере
+    # получает за круг столько же, сколько пользователь с одной задачей (с поправкой на вес)
+    def __init__(self, quantum: float = 1.0):
+        self.quantum = quantum
+        self._queues: dict[Hashable, deque[tuple[T, float]]] = {}
+        self._deficit: dict[Hashable, float] = {}
+        self._weights: dict[Hashable, float] = {}
+        self._active: deque[Hashable] = deque()
+        self._in_turn = False
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, key: Hashable, item: T, cost: float = 1.0, weight: float = 1.0) -> None:
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._deficit[key] = 0.0
+            self._active.append(key)
+        self._queues[key].append((item, cost))
+        self._weights[key] = weight
+        self._size += 1
+
+    def pop(self) -> T:
+        if not self._size:
+            raise IndexError('Буфер планировщика пуст')
+        while True:
+            key = self._active[0]
+            queue = self._queues[key]
+            if not self._in_turn:
+                self._deficit[key] += self.quantum * self._weights[key]
+                self._in_turn = True
+            item, cost = queue[0]
+            if self._deficit[key] >= cost:
+                queue.popleft()
+                self._deficit[key] -= cost
+                self._size -= 1
+                if not queue:
+                    # Опустевший ключ выходит из круга вместе с остатком дефицита
+                    del self._queues[key], self._deficit[key], self._weights[key]
+                    self._active.popleft()
+                    self._in_turn = False
+                return item
+            self._active.rotate(-1)
+            self._in_turn = False
+
+    def take(self, count: int) -> list[T]:
+        return [self.pop() for _ in range(min(count, self._size))]
+
+    def backlog(self) -> dict[Hashable, int]:
+        return {key: len(queue) for key, queue in self._queues.items()}
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', 3600))
+FORECAST_CACHE_SIZE = int(os.getenv('FORECAST_CACHE_SIZE', 4096))
+
+CacheKey = tuple[Optional[str], int, datetime]
+
+
+class CachedForecast(NamedTuple):
+    result: list[int]
+    trip_costs: Optional[list[float]]
+    expires_at: float
+
+
+class ForecastCache:
+    def __init__(self, ttl: int = FORECAST_CACHE_TTL, max_size: int = FORECAST_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items: OrderedDict[CacheKey, CachedForecast] = OrderedDict()
+
+    def get(self, key: CacheKey) -> Optional[CachedForecast]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item.expires_at <= time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key: CacheKey, result: list[int], trip_costs: Optional[list[float]] = None) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            old = self._items.get(key)
+            if trip_costs is None and old is not None and old.result == result:
+                trip_costs = old.trip_costs
+            self._items[key] = CachedForecast(result, trip_costs, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._items),
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,58 @@
+import os
+from datetime import UTC, datetime, timedelta
+from typing import Optional
+
+from db.models.forecast import Forecast
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+PRECOMPUTE_MAX_AGE_SECONDS = int(os.getenv('PRECOMPUTE_MAX_AGE_SECONDS', 7200))
+FORECAST_YEAR = 2024
+
+
+def forecast_target(month: int, day: int, hour: int) -> datetime:
+    return datetime(FORECAST_YEAR, month, day, hour)
+
+
+def next_hour_target(now: Optional[datetime] = None) -> datetime:
+    next_hour = (now or datetime.now(UTC)) + timedelta(hours=1)
+    return forecast_target(next_hour.month, next_hour.day, next_hour.hour)
+
+
+class ForecastManager:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get_fresh(self, model: str, district: int, target: datetime) -> Optional[Forecast]:
+        target = target.replace(tzinfo=UTC)
+        stmt = select(Forecast).where(
+            Forecast.model == model,
+            Forecast.district == district,
+            Forecast.target == target,
+            Forecast.created_at >= datetime.now(UTC) - timedelta(seconds=PRECOMPUTE_MAX_AGE_SECONDS),
+        )
+        return self.session.exec(stmt).first()
+
+    def save(
+            self, model: str, model_version: Optional[str], target: datetime,
+            districts: list[int], results: list[list[int]],
+            trip_costs: Optional[list[list[float]]] = None) -> None:
+        target = target.replace(tzinfo=UTC)
+        self.session.exec(delete(Forecast).where(
+            Forecast.model == model,
+            (Forecast.target == target) | (Forecast.target < target - timedelta(days=1)),
+        ))
+        now = datetime.now(UTC)
+        self.session.add_all([
+            Forecast(
+                model=model,
+                district=district,
+                target=target,
+                model_version=model_version,
+                result=str(res),
+                trip_costs=str(trip_costs[i]) if trip_costs is not None else None,
+                created_at=now,
+            )
+            for i, (district, res) in enumerate(zip(districts, results))
+        ])
+        self.session.commit()
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from multiprocessing.connection import Client, Connection
+from typing import Any, Callable, Optional
+
+import numpy as np
+from services.core.lstm_state import IncrementalLSTM
+from services.core.ml_model import LSTM, MLP, FusedLSTM, MLModel, ModelRegistry
+from services.data_manager import DataManager
+from services.forecast_manager import next_hour_target
+from services.weather_manager import WeatherManager
+
+LSTM_INCREMENTAL = os.getenv('LSTM_INCREMENTAL', 'off')
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv('INFERENCE_TIMEOUT_SECONDS', 30))
+# Общий ключ клиента и сервера инференса: по сокету передаётся pickle, без ключа соединение не открывается
+INFERENCE_AUTHKEY = os.getenv('INFERENCE_AUTHKEY', '').encode()
+
+Forecast = tuple[str, list[int], list[list[int]]]
+
+
+class LocalInference:
+    # Модели, датасет и погода в этом же процессе
+    def __init__(self, data_path: str):
+        self.data = DataManager(data_path)
+        self.weather = WeatherManager()
+        self.incremental: dict[str, IncrementalLSTM] = {}
+        self._data_listeners: list[Callable[[], None]] = []
+        ModelRegistry.on_reload(self.incremental.clear)
+
+    def on_data_change(self, listener: Callable[[], None]) -> None:
+        self._data_listeners.append(listener)
+
+    def version(self, model_name: str) -> str:
+        return ModelRegistry.get(model_name).version
+
+    def data_version(self) -> Optional[str]:
+        return self.data.version
+
+    def forecast(self, model_name: str, target: datetime, district_ids: Optional[list[int]] = None) -> Forecast:
+        model = ModelRegistry.get(model_name)
+        forecaster = self._incremental(model)
+        if forecaster is None:
+            ids, sequences = self.data.create_sequences(target, district_ids=district_ids)
+            return model.version, ids, model.predict_trips(sequences).tolist() if ids else []
+
+        if LSTM_INCREMENTAL == 'validate':
+            # Отдаём результат полного окна, инкрементальный только сверяем с ним
+            ids, output, report = forecaster.validate(target, district_ids)
+            logging.info(f'Сверка инкрементального LSTM {model.version} на {target}: {report}, {forecaster.stats}')
+        else:
+            ids, output = forecaster.forecast(target, district_ids)
+        return model.version, ids, np.ceil(np.clip(output, 0, None)).astype(int).tolist()
+
+    def costs(self, district: int, target: datetime, trips: list[int]) -> list[float]:
+        return ModelRegistry.get('mlp').predict_costs(district, target, trips)
+
+    def warm(self, names: Optional[list[str]] = None, batch_sizes: tuple[int, ...] = (1,),
+             full_batch_models: tuple[str, ...] = ()) -> dict[str, Any]:
+        touched = self.data.touch()
+        names = ModelRegistry.warm_up(names)
+        target = next_hour_target()
+        districts, sequences = self.data.create_sequences(target)
+        if not len(districts):
+            # Модели загружены, но прогнать их не на чем
+            logging.warning('Датасет пуст, прогрев моделей на данных пропущен')
+            names = []
+        for name in names:
+            model = ModelRegistry.get(name)
+            if isinstance(model, LSTM):
+                sizes = set(batch_sizes) | ({len(districts)} if name in full_batch_models else set())
+                for size in sorted(sizes):
+                    model.predict_trips(np.resize(sequences, (size, *sequences.shape[1:])))
+                if self._incremental(model) is not None:
+                    self.forecast(name, target)
+            elif isinstance(model, MLP):
+                model.predict_costs(districts[0], target, [1] * 24)
+        return {'models': ModelRegistry.stats(), 'data_mb': round(touched / 2 ** 20)}
+
+    def reload_models(self) -> list[str]:
+        reloaded = ModelRegistry.reload_changed()
+        if reloaded:
+            self.warm(reloaded)
+        return reloaded
+
+    def refresh_data(self) -> bool:
+        if not self.data.refresh():
+            return False
+        self.data.touch()
+        for listener in self._data_listeners:
+            listener()
+        return True
+
+    def refresh_weather(self) -> None:
+        self.weather.refresh()
+
+    def _incremental(self, model: MLModel) -> Optional[IncrementalLSTM]:
+        if LSTM_INCREMENTAL not in ('on', 'validate') or not isinstance(model, FusedLSTM):
+            return None
+        if model.version not in self.incremental:
+            self.incremental[model.version] = IncrementalLSTM(model.model)
+        return self.incremental[model.version]
+
+
+class RemoteInference:
+    # Клиент сервера инференса (workers/inference_server.py): у каждого потока своё соединение с сокетом
+    def __init__(self, path: str, timeout: float = INFERENCE_TIMEOUT_SECONDS, authkey: bytes = INFERENCE_AUTHKEY):
+        if not authkey:
+            raise ValueError('INFERENCE_AUTHKEY не задан: без общего ключа сервер инференса недоступен')
+        self.path = path
+        self.timeout = timeout
+        self.authkey = authkey
+        self._local = threading.local()
+        self._data_version: Optional[str] = None
+        self._data_listeners: list[Callable[[], None]] = []
+
+    def on_data_change(self, listener: Callable[[], None]) -> None:
+        self._data_listeners.append(listener)
+
+    def version(self, model_name: str) -> str:
+        version, data_version = self._call('version', model_name)
+        if data_version != self._data_version:
+            changed = self._data_version is not None
+            self._data_version = data_version
+            if changed:
+                for listener in self._data_listeners:
+                    listener()
+        return version
+
+    def data_version(self) -> Optional[str]:
+        # Версия датасета сервера на момент последнего version()
+        return self._data_version
+
+    def forecast(self, model_name: str, target: datetime, district_ids: Optional[list[int]] = None) -> Forecast:
+        return self._call('forecast', model_name, target, district_ids)
+
+    def costs(self, district: int, target: datetime, trips: list[int]) -> list[float]:
+        return self._call('costs', district, target, trips)
+
+    def warm(self, names: Optional[list[str]] = None, batch_sizes: tuple[int, ...] = (1,),
+             full_batch_models: tuple[str, ...] = ()) -> dict[str, Any]:
+        # Модели прогревает сам сервер, здесь только ждём, пока он начнёт отвечать
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return {'server': self._call('stats')}
+            except ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(1)
+
+    def _connection(self) -> Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            try:
+                connection = Client(self.path, family='AF_UNIX', authkey=self.authkey)
+            except OSError as e:
+                raise ConnectionError(f'Сервер инференса {self.path} недоступен: {e}') from e
+            self._local.connection = connection
+        return connection
+
+    def _drop(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection.close()
+
+    def _call(self, op: str, *args):
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.send((op, args))
+                ready = connection.poll(self.timeout)
+                if ready:
+                    status, value = connection.recv()
+            except (EOFError, OSError) as e:
+                # Сервер перезапускался: переподключаемся и повторяем запрос один раз
+                self._drop()
+                if attempt:
+                    raise ConnectionError(f'Сервер инференса {self.path} недоступен: {e}') from e
+                continue
+            if not ready:
+                self._drop()
+                raise TimeoutError(f'Сервер инференса не ответил на {op} за {self.timeout} с')
+            if status == 'error':
+                raise RuntimeError(f'Ошибка сервера инференса: {value}')
+            return value
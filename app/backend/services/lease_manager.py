@@ -0,0 +1,79 @@
+import json
+import os
+import socket
+from datetime import UTC, datetime, timedelta
+from typing import Optional
+
+from db.models.forecast_lease import ForecastLease
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+LEASE_OWNER = f'{socket.gethostname()}:{os.getpid()}'
+LEASE_SECONDS = int(os.getenv('COALESCE_LEASE_SECONDS', 30))
+LEASE_RESULT_SECONDS = int(os.getenv('COALESCE_RESULT_SECONDS', 3600))
+
+
+class LeaseManager:
+    def __init__(self, session: Session, owner: str = LEASE_OWNER):
+        self.session = session
+        self.owner = owner
+
+    def acquire(self, key: str) -> bool:
+        now = datetime.now(UTC)
+        expires_at = now + timedelta(seconds=LEASE_SECONDS)
+        try:
+            self.session.add(ForecastLease(key=key, owner=self.owner, expires_at=expires_at))
+            self.session.commit()
+            return True
+        except IntegrityError:
+            self.session.rollback()
+
+        stmt = (
+            update(ForecastLease)
+            .where(ForecastLease.key == key, ForecastLease.expires_at < now)
+            .values(owner=self.owner, status='running', result=None, trip_costs=None,
+                    expires_at=expires_at, updated_at=now)
+        )
+        taken = self.session.exec(stmt).rowcount == 1
+        self.session.commit()
+        return taken
+
+    def get_result(self, key: str) -> Optional[tuple[list[int], Optional[list[float]]]]:
+        stmt = select(ForecastLease).where(
+            ForecastLease.key == key,
+            ForecastLease.status == 'done',
+            ForecastLease.expires_at >= datetime.now(UTC),
+        )
+        lease = self.session.exec(stmt).first()
+        if lease is None:
+            return None
+        trip_costs = json.loads(lease.trip_costs) if lease.trip_costs else None
+        return json.loads(lease.result), trip_costs
+
+    def publish(self, key: str, result: list[int], trip_costs: Optional[list[float]] = None) -> None:
+        now = datetime.now(UTC)
+        stmt = (
+            update(ForecastLease)
+            .where(ForecastLease.key == key)
+            .values(status='done', result=json.dumps(result),
+                    trip_costs=json.dumps(trip_costs) if trip_costs is not None else None,
+                    expires_at=now + timedelta(seconds=LEASE_RESULT_SECONDS), updated_at=now)
+        )
+        self.session.exec(stmt)
+        self.session.commit()
+
+    def release(self, key: str) -> None:
+        stmt = delete(ForecastLease).where(
+            ForecastLease.key == key,
+            ForecastLease.owner == self.owner,
+            ForecastLease.status == 'running',
+        )
+        self.session.exec(stmt)
+        self.session.commit()
+
+    def purge_expired(self) -> int:
+        stmt = delete(ForecastLease).where(ForecastLease.expires_at < datetime.now(UTC))
+        removed = self.session.exec(stmt).rowcount
+        self.session.commit()
+        return removed
@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import UTC, datetime
 from typing import TYPE_CHECKING
 
+from db.models.forecast import Forecast
 from db.models.prediction import Prediction
 from services.core.enums import TaskStatus
 from sqlmodel import Session, select
@@ -28,7 +29,7 @@ class PredictionManager:
         today = datetime.now(UTC).date()
         stmt = select(Prediction).where(
             Prediction.user_id == self.ctx.user.id,
-            Prediction.timestamp >= datetime.combine(today, datetime.min.time())
+            Prediction.timestamp >= datetime.combine(today, datetime.min.time(), tzinfo=UTC)
         )
         count = self.session.exec(stmt).all()
         if len(count) >= num:
@@ -55,6 +56,32 @@ class PredictionManager:
 
         return initial_pred
 
+    def create_from_forecast(
+            self, forecast: Forecast, city: str,
+            cost: float, hour: int) -> Prediction:
+        user = self.ctx.user
+        if cost != 0:
+            self.ctx.balance.withdraw(cost, description='Оплата предсказания')
+
+        pred = Prediction(
+            user_id=user.id,
+            model=forecast.model,
+            hour=hour,
+            district=forecast.district,
+            city=city,
+            cost=cost,
+            result=forecast.result,
+            trip_costs=forecast.trip_costs if cost > 0 else None,
+            model_version=forecast.model_version,
+            status=TaskStatus.COMPLETED,
+            timestamp=datetime.now(UTC)
+        )
+        self.session.add(pred)
+        self.session.commit()
+        self.session.refresh(pred)
+
+        return pred
+
     def get_cost(self) -> float:
         user = self.ctx.user
         if user.status == 'bronze':
@@ -0,0 +1,52 @@
+import os
+import threading
+from collections import defaultdict, deque
+from typing import Optional
+
+import numpy as np
+
+TIER_SLO_SECONDS = os.getenv('TIER_SLO_SECONDS', 'diamond:5,gold:15,silver:60,bronze:300')
+TIER_LATENCY_WINDOW = int(os.getenv('TIER_LATENCY_WINDOW', 1000))
+
+
+def parse_slo(spec: str) -> dict[str, float]:
+    slo = {}
+    for item in spec.split(','):
+        if item.strip():
+            tier, seconds = item.split(':')
+            slo[tier.strip()] = float(seconds)
+    return slo
+
+
+class TierLatency:
+    # Время от постановки задачи в очередь до записи результата по уровням статуса.
+    # p95 последних window задач уровня сравнивается с его SLO
+    def __init__(self, slo: Optional[dict[str, float]] = None, window: int = TIER_LATENCY_WINDOW):
+        self.slo = parse_slo(TIER_SLO_SECONDS) if slo is None else slo
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts: dict[str, int] = defaultdict(int)
+
+    def observe(self, tier: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[tier].append(max(seconds, 0.0))
+            self._counts[tier] += 1
+
+    def report(self) -> dict[str, dict]:
+        with self._lock:
+            samples = {tier: np.array(values) for tier, values in self._samples.items() if values}
+            counts = dict(self._counts)
+        report = {}
+        for tier, values in samples.items():
+            p50, p95 = np.percentile(values, [50, 95])
+            slo = self.slo.get(tier)
+            report[tier] = {
+                'count': counts[tier],
+                'p50': round(float(p50), 3),
+                'p95': round(float(p95), 3),
+                'max': round(float(values.max()), 3),
+                'slo': slo,
+                'ok': slo is None or bool(p95 <= slo),
+            }
+        return report
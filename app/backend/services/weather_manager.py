@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from meteostat import Hourly, Stations
+
+WEATHER_PATH = os.getenv('WEATHER_PATH', 'data/weather.csv')
+WEATHER_START = os.getenv('WEATHER_START', '2024-01-01')
+WEATHER_COLUMNS = ['temp', 'prcp', 'wspd']
+NYC_COORDS = (40.7128, -74.0060)
+
+
+def _to_hours(dates: pd.DatetimeIndex) -> np.ndarray:
+    return dates.values.astype('datetime64[h]').astype(np.int64)
+
+
+class WeatherManager:
+    _lock = threading.Lock()
+    _station: Optional[str] = None
+    _snapshot: Optional[tuple[int, np.ndarray, np.ndarray]] = None
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path or WEATHER_PATH
+        if WeatherManager._snapshot is None:
+            self.load()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @classmethod
+    def station(cls) -> str:
+        if cls._station is None:
+            cls._station = Stations().nearby(*NYC_COORDS).fetch(1).index[0]
+        return cls._station
+
+    def load(self) -> None:
+        if os.path.exists(self.path):
+            weather = pd.read_csv(self.path, parse_dates=['time'], float_precision='round_trip').set_index('time')
+            logging.info(f'Погода загружена из {self.path}: {len(weather)} часов')
+        else:
+            try:
+                weather = self.fetch(pd.Timestamp(WEATHER_START), pd.Timestamp(datetime.now()))
+                logging.info(f'Погода загружена из Meteostat: {len(weather)} часов')
+            except Exception as e:
+                logging.exception(f'Не удалось загрузить погоду из Meteostat: {e}')
+                weather = pd.DataFrame(columns=WEATHER_COLUMNS)
+        with WeatherManager._lock:
+            WeatherManager._snapshot = None
+            WeatherManager._merge(weather)
+
+    def refresh(self) -> None:
+        snapshot = WeatherManager._snapshot
+        if snapshot is None or not snapshot[2].any():
+            start = pd.Timestamp(WEATHER_START)
+        else:
+            start_hour, _, present = snapshot
+            last_hour = start_hour + int(np.flatnonzero(present)[-1])
+            start = pd.Timestamp(np.datetime64(last_hour, 'h')) + timedelta(hours=1)
+        end = pd.Timestamp(datetime.now()).floor('h')
+        if start > end:
+            return
+        weather = self.fetch(start, end)
+        with WeatherManager._lock:
+            WeatherManager._merge(weather)
+        logging.info(f'Погода обновлена: +{len(weather)} часов начиная с {start}')
+
+    @classmethod
+    def fetch(cls, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        weather = Hourly(cls.station(), start.to_pydatetime(), end.to_pydatetime()).fetch()
+        return weather.reindex(columns=WEATHER_COLUMNS, fill_value=0)
+
+    @staticmethod
+    def save(weather: pd.DataFrame, path: str) -> None:
+        frame = weather.reindex(columns=WEATHER_COLUMNS, fill_value=0)
+        frame.index.name = 'time'
+        tmp_path = f'{path}.tmp'
+        frame.to_csv(tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _merge(cls, weather: pd.DataFrame) -> None:
+        if weather.empty:
+            if cls._snapshot is None:
+                cls._snapshot = (0, np.zeros((0, len(WEATHER_COLUMNS)), dtype=np.float64), np.zeros(0, dtype=bool))
+            return
+        hours = _to_hours(pd.DatetimeIndex(weather.index))
+        values = weather.reindex(columns=WEATHER_COLUMNS, fill_value=0).to_numpy(dtype=np.float64)
+
+        if cls._snapshot is not None and len(cls._snapshot[1]):
+            old_start, old_values, old_present = cls._snapshot
+            start = min(old_start, int(hours.min()))
+            end = max(old_start + len(old_values), int(hours.max()) + 1)
+        else:
+            old_start, old_values, old_present = 0, None, None
+            start, end = int(hours.min()), int(hours.max()) + 1
+
+        new_values = np.full((end - start, len(WEATHER_COLUMNS)), np.nan, dtype=np.float64)
+        new_present = np.zeros(end - start, dtype=bool)
+        if old_values is not None:
+            offset = old_start - start
+            new_values[offset:offset + len(old_values)] = old_values
+            new_present[offset:offset + len(old_present)] = old_present
+        new_values[hours - start] = values
+        new_present[hours - start] = True
+
+        cls._snapshot = (start, new_values, new_present)
+
+    @classmethod
+    def lookup(cls, dates: pd.DatetimeIndex) -> pd.DataFrame:
+        if cls._snapshot is None:
+            cls()
+        start, values, present = cls._snapshot
+
+        idx = _to_hours(dates) - start
+        result = np.zeros((len(dates), len(WEATHER_COLUMNS)), dtype=np.float64)
+        # Как и прежний запрос Hourly(t, t + 1h): берём час t, иначе t + 1h, иначе нули
+        for shift in (1, 0):
+            pos = idx + shift
+            valid = (pos >= 0) & (pos < len(values))
+            valid[valid] = present[pos[valid]]
+            result[valid] = values[pos[valid]]
+        return pd.DataFrame(result, index=dates, columns=WEATHER_COLUMNS)
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import logging
+from itertools import cycle
+from typing import Iterator, Optional
+
+import aio_pika
+from aio_pika.abc import AbstractRobustChannel, AbstractRobustConnection
+from workers.connection import QUEUE_NAME, RABBITMQ_HOST, declare_task_queue
+from workers.publisher import RABBITMQ_CONFIRM_DELIVERY, RABBITMQ_PUBLISH_CHANNELS
+
+
+# Во время переподключения robust-канал отвечает ChannelInvalidStateError (это не AMQPError),
+# а подтверждение может не прийти вовсе
+_RETRIED_ERRORS = (
+    aio_pika.exceptions.AMQPError,
+    aio_pika.exceptions.ChannelInvalidStateError,
+    ConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+class AsyncTaskPublisher:
+    # Асинхронный вариант TaskPublisher для async-эндпоинтов: одно robust-соединение на процесс,
+    # которое aio-pika само восстанавливает вместе с каналами.
+    # Каналы не захватываются на время публикации: на каждом одновременно ждут подтверждения
+    # сколько угодно сообщений, поэтому в полёте могут быть тысячи запросов
+    def __init__(self, host: str = RABBITMQ_HOST, channels: int = RABBITMQ_PUBLISH_CHANNELS,
+                 confirm: bool = RABBITMQ_CONFIRM_DELIVERY):
+        self.host = host
+        self.size = max(1, channels)
+        self.confirm = confirm
+        self._connection: Optional[AbstractRobustConnection] = None
+        self._channels: Optional[Iterator[AbstractRobustChannel]] = None
+        self._lock = asyncio.Lock()
+
+    async def publish(self, payload: dict, routing_key: str = QUEUE_NAME) -> None:
+        message = aio_pika.Message(
+            body=json.dumps(payload).encode(),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            priority=payload.get('priority'),
+        )
+        for attempt in range(2):
+            channel = await self._channel()
+            try:
+                # С подтверждениями publish завершается только после ack брокера
+                await channel.default_exchange.publish(message, routing_key=routing_key)
+                return
+            except _RETRIED_ERRORS as e:
+                if attempt:
+                    raise
+                logging.warning(f'Публикация в RabbitMQ не удалась, повторяем: {type(e).__name__}: {e}')
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._connection is not None:
+                await self._connection.close()
+            self._connection = None
+            self._channels = None
+
+    async def _channel(self) -> AbstractRobustChannel:
+        if self._channels is None:
+            async with self._lock:
+                if self._channels is None:
+                    await self._connect()
+        return next(self._channels)
+
+    async def _connect(self) -> None:
+        connection = await aio_pika.connect_robust(host=self.host)
+        try:
+            channels = []
+            for _ in range(self.size):
+                channel = await connection.channel(publisher_confirms=self.confirm)
+                channels.append(channel)
+            # Очередь объявляется один раз: она durable и переживает переподключения
+            await declare_task_queue(connection)
+        except BaseException:
+            # Иначе брошенное robust-соединение так и продолжало бы переподключаться
+            await connection.close()
+            raise
+        self._connection = connection
+        self._channels = cycle(channels)
+
+
+async_task_publisher = AsyncTaskPublisher()
@@ -1,17 +1,51 @@
+import logging
 import os
 from typing import Optional
 
+import aio_pika
 import pika
+from aiormq.exceptions import ChannelPreconditionFailed
 from pika import BlockingConnection
 from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import ChannelClosedByBroker
 
 RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'rabbitmq')
 QUEUE_NAME = os.getenv('RABBITMQ_QUEUE', 'ml_tasks')
+# Приоритеты задач (см. workers/publisher.py:task_priority); 0 - обычная FIFO-очередь
+QUEUE_MAX_PRIORITY = int(os.getenv('RABBITMQ_MAX_PRIORITY', 7))
+QUEUE_ARGUMENTS = {'x-max-priority': QUEUE_MAX_PRIORITY} if QUEUE_MAX_PRIORITY > 0 else None
+
+_PRIORITY_WARNING = (
+    'Очередь {name} уже создана без x-max-priority, задачи обрабатываются без приоритетов. '
+    'Чтобы включить их, дождитесь пустой очереди и удалите её: rabbitmqctl delete_queue {name}'
+)
 
 
 def get_rabbitmq_connection(queue_name: Optional[str] = None) -> tuple[BlockingConnection, BlockingChannel, str]:
     name = queue_name or QUEUE_NAME
     conn = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
     ch = conn.channel()
-    ch.queue_declare(queue=name, durable=True)
+    try:
+        ch.queue_declare(queue=name, durable=True, arguments=QUEUE_ARGUMENTS)
+    except ChannelClosedByBroker as e:
+        # Аргументы существующей очереди менять нельзя: брокер отвечает 406 и закрывает канал
+        if e.reply_code != 406 or QUEUE_ARGUMENTS is None:
+            raise
+        logging.warning(_PRIORITY_WARNING.format(name=name))
+        ch = conn.channel()
+        ch.queue_declare(queue=name, durable=True)
     return conn, ch, name
+
+
+async def declare_task_queue(connection: aio_pika.abc.AbstractConnection, name: str = QUEUE_NAME) -> None:
+    # Объявляем на отдельном канале: после 406 брокер закрывает канал, на котором это случилось
+    channel = await connection.channel()
+    try:
+        await channel.declare_queue(name, durable=True, arguments=QUEUE_ARGUMENTS)
+    except ChannelPreconditionFailed:
+        if QUEUE_ARGUMENTS is None:
+            raise
+        logging.warning(_PRIORITY_WARNING.format(name=name))
+        channel = await connection.channel()
+        await channel.declare_queue(name, durable=True)
+    await channel.close()
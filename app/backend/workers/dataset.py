@@ -0,0 +1,80 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+from services.data_manager import DataManager
+
+
+def _rss() -> dict[str, float]:
+    stats = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                stats[key] = int(value.split()[0]) / 1024
+    return stats
+
+
+def probe(path: str) -> dict[str, object]:
+    started = time.perf_counter()
+    DataManager(path)
+    loaded = time.perf_counter() - started
+    rss_loaded = _rss()
+
+    index = DataManager.current_index()
+    target = np.datetime64(int(index.ts.max()), 'h').item()
+    started = time.perf_counter()
+    for district_id in index.offsets:
+        DataManager.create_single_sequence(target, district_id)
+    first_pass = time.perf_counter() - started
+
+    return {
+        'path': path,
+        'load_s': round(loaded, 3),
+        'first_pass_s': round(first_pass, 3),
+        'districts': len(index.offsets),
+        'rss_after_load_mb': rss_loaded,
+        'rss_after_first_pass_mb': _rss(),
+    }
+
+
+def bench(paths: list[str]) -> None:
+    for path in paths:
+        out = subprocess.run(
+            [sys.executable, __file__, 'probe', path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        print(out.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Подготовка и замеры датасета для воркера')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    convert_cmd = sub.add_parser('convert', help='CSV -> каталог .npy + manifest.json')
+    convert_cmd.add_argument('csv_path')
+    convert_cmd.add_argument('store_path')
+
+    publish_cmd = sub.add_parser('publish', help='собрать новую версию в ROOT/<версия> и переключить ROOT/current')
+    publish_cmd.add_argument('csv_path')
+    publish_cmd.add_argument('root')
+    publish_cmd.add_argument('--keep', type=int, default=2)
+
+    probe_cmd = sub.add_parser('probe', help='холодный старт DataManager в текущем процессе')
+    probe_cmd.add_argument('path')
+
+    bench_cmd = sub.add_parser('bench', help='сравнить холодный старт и RSS для нескольких форматов')
+    bench_cmd.add_argument('paths', nargs='+')
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        DataManager.convert_csv(args.csv_path, args.store_path)
+    elif args.command == 'publish':
+        print(DataManager.publish_store(args.csv_path, args.root, keep=args.keep))
+    elif args.command == 'probe':
+        print(json.dumps(probe(args.path)))
+    else:
+        bench(args.paths)
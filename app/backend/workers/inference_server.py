@@ -0,0 +1,174 @@
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.connection import Connection, Listener
+from typing import Any
+
+from services.core.ml_model import ModelRegistry
+from services.inference import INFERENCE_AUTHKEY, LocalInference
+
+LOGDIR = os.getenv('LOG_DIR', '/logs')
+os.makedirs(LOGDIR, exist_ok=True)
+logging.basicConfig(
+    filename=os.path.join(LOGDIR, 'inference_server.log'),
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(message)s'
+)
+
+INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET', '/run/inference/inference.sock')
+INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', 64))
+INFERENCE_BATCH_TIMEOUT_MS = int(os.getenv('INFERENCE_BATCH_TIMEOUT_MS', 5))
+DATA_PATH = os.getenv('DATA_PATH', 'data/lstm_data_v2.csv')
+WEATHER_REFRESH_SECONDS = int(os.getenv('WEATHER_REFRESH_SECONDS', 3600))
+DATA_REFRESH_SECONDS = int(os.getenv('DATA_REFRESH_SECONDS', 60))
+MODEL_WATCH_SECONDS = int(os.getenv('MODEL_WATCH_SECONDS', 60))
+
+
+class PendingForecast:
+    def __init__(self, args: tuple):
+        self.model_name, self.target, self.district_ids = args
+        self.done = threading.Event()
+        self.reply: tuple[str, Any] = ('error', 'не посчитано')
+
+
+class InferenceServer:
+    # Один процесс держит модели и датасет; запросы прогнозов от всех потребителей копятся
+    # до INFERENCE_BATCH_TIMEOUT_MS и считаются одним пакетом на (модель, час)
+    def __init__(self, engine: LocalInference, path: str,
+                 batch_size: int = INFERENCE_BATCH_SIZE, batch_timeout_ms: int = INFERENCE_BATCH_TIMEOUT_MS,
+                 authkey: bytes = INFERENCE_AUTHKEY):
+        # Клиенты присылают pickle, поэтому без общего ключа сервер не запускается
+        if not authkey:
+            raise ValueError('INFERENCE_AUTHKEY не задан: сервер инференса не запускается без общего ключа')
+        self.engine = engine
+        self.path = path
+        self.authkey = authkey
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout_ms / 1000
+        self.pending: queue.Queue[PendingForecast] = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+
+    def serve_forever(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        listener = Listener(self.path, family='AF_UNIX', authkey=self.authkey)
+        threading.Thread(target=self.batch_loop, daemon=True).start()
+        logging.info(f'Сервер инференса слушает {self.path}')
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                logging.exception(f'Ошибка подключения клиента: {e}')
+                continue
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    op, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                connection.send(self.dispatch(op, args))
+
+    def dispatch(self, op: str, args: tuple) -> tuple[str, Any]:
+        try:
+            if op == 'forecast':
+                request = PendingForecast(args)
+                self.pending.put(request)
+                request.done.wait()
+                return request.reply
+            if op == 'version':
+                return 'ok', (self.engine.version(*args), self.engine.data_version())
+            if op == 'costs':
+                return 'ok', self.engine.costs(*args)
+            if op == 'stats':
+                return 'ok', {'models': ModelRegistry.stats(), 'batches': self.batches, 'requests': self.requests}
+            return 'error', f'неизвестная операция {op}'
+        except Exception as e:
+            logging.exception(f'Ошибка операции {op}: {e}')
+            return 'error', f'{type(e).__name__}: {e}'
+
+    def batch_loop(self) -> None:
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.batch_timeout
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.run_batch(batch)
+
+    def run_batch(self, batch: list[PendingForecast]) -> None:
+        groups: dict[tuple, list[PendingForecast]] = defaultdict(list)
+        for request in batch:
+            groups[(request.model_name, request.target)].append(request)
+
+        for (model_name, target), requests in groups.items():
+            if any(request.district_ids is None for request in requests):
+                district_ids = None
+            else:
+                district_ids = sorted({d for request in requests for d in request.district_ids})
+            try:
+                version, ids, results = self.engine.forecast(model_name, target, district_ids)
+                by_district = dict(zip(ids, results))
+                for request in requests:
+                    wanted = ids
+                    if request.district_ids is not None:
+                        wanted = [d for d in request.district_ids if d in by_district]
+                    request.reply = 'ok', (version, wanted, [by_district[d] for d in wanted])
+            except Exception as e:
+                logging.exception(f'Ошибка пакетного прогноза {model_name} на {target}: {e}')
+                for request in requests:
+                    request.reply = 'error', f'{type(e).__name__}: {e}'
+            for request in requests:
+                request.done.set()
+
+        self.batches += 1
+        self.requests += len(batch)
+        if len(batch) > 1:
+            logging.info(f'Пакет из {len(batch)} запросов, групп: {len(groups)}')
+
+
+def _every(seconds: int, action, description: str) -> None:
+    while True:
+        time.sleep(seconds)
+        try:
+            result = action()
+            if result:
+                logging.info(f'🔄 {description}: {result}')
+        except Exception as e:
+            logging.exception(f'Ошибка: {description}: {e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сервер инференса для воркеров на одной машине (Unix-сокет)')
+    parser.add_argument('--socket', default=INFERENCE_SOCKET)
+    parser.add_argument('--batch-size', type=int, default=INFERENCE_BATCH_SIZE)
+    parser.add_argument('--batch-timeout-ms', type=int, default=INFERENCE_BATCH_TIMEOUT_MS)
+    args = parser.parse_args()
+
+    engine = LocalInference(DATA_PATH)
+    server = InferenceServer(engine, args.socket, args.batch_size, args.batch_timeout_ms)
+    started = time.perf_counter()
+    stats = engine.warm(batch_sizes=(1, args.batch_size))
+    logging.info(f'🔥 Прогрев сервера инференса за {time.perf_counter() - started:.2f} с: {stats}')
+
+    for seconds, action, description in (
+        (MODEL_WATCH_SECONDS, engine.reload_models, 'Модели перезагружены'),
+        (DATA_REFRESH_SECONDS, engine.refresh_data, 'Датасет переключён'),
+        (WEATHER_REFRESH_SECONDS, engine.refresh_weather, 'Погода обновлена'),
+    ):
+        threading.Thread(target=_every, args=(seconds, action, description), daemon=True).start()
+
+    server.serve_forever()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from services.core.lstm_state import IncrementalLSTM
+from services.core.ml_model import LSTM, FusedLSTM, ModelRegistry, NumpyLSTM, _checksum, registry
+from services.core.numpy_lstm import export_keras, fuse_scalers
+from services.data_manager import DataManager
+
+LSTM_MODELS = [name for name in registry if name.startswith('lstm')]
+
+
+def _paths(name: str) -> tuple[str, str, str]:
+    _, path_name = registry[name]
+    keras_path = ModelRegistry._model_path(name, path_name)
+    base = os.path.splitext(keras_path)[0]
+    return keras_path, f'{base}.npz', f'{base}_fused.npz'
+
+
+def export(names: list[str]) -> None:
+    for name in names:
+        keras_path, runtime_path, fused_path = _paths(name)
+        reference = NumpyLSTM(keras_path)
+        runtime = export_keras(keras_path, runtime_path, _checksum([keras_path]))
+        fused = fuse_scalers(runtime_path, reference.scaler_X, reference.scaler_y, fused_path,
+                             _checksum(LSTM.artifacts(keras_path)))
+        print(f'{name}: {keras_path} -> {runtime}')
+        print(f'{name}: {runtime_path} -> {fused}')
+
+
+def _sample(model: LSTM, batch_size: int, seed: int = 0) -> np.ndarray:
+    # Сырые признаки в масштабе обучающей выборки: mean + scale * N(0, 1)
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal((batch_size, 72, model.scaler_X.n_features_in_))
+    return (model.scaler_X.mean_ + model.scaler_X.scale_ * noise).astype(np.float32)
+
+
+def check(names: list[str], batch_size: int, atol: float) -> bool:
+    ok = True
+    for name in names:
+        keras_path, _, _ = _paths(name)
+        reference = LSTM(keras_path)
+        raw = _sample(reference, batch_size)
+        expected = reference.scaler_y.inverse_transform(
+            reference.predict_batch(reference.scaler_X.transform(raw.reshape(-1, raw.shape[-1])).reshape(raw.shape))
+            .reshape(-1, 1)
+        ).reshape(batch_size, -1)
+        expected_trips = reference.predict_trips(raw)
+        for runtime in (NumpyLSTM(keras_path), FusedLSTM(keras_path)):
+            if isinstance(runtime, FusedLSTM):
+                actual = runtime.predict_batch(raw)
+            else:
+                scaled = runtime.scaler_X.transform(raw.reshape(-1, raw.shape[-1])).reshape(raw.shape)
+                actual = runtime.scaler_y.inverse_transform(
+                    runtime.predict_batch(scaled).reshape(-1, 1)
+                ).reshape(batch_size, -1)
+            # Допуск относительный: сравниваем в поездках, а не в масштабированном пространстве
+            max_diff = float((np.abs(expected - actual) / reference.scaler_y.scale_[0]).max())
+            trips_diff = int(np.abs(expected_trips - runtime.predict_trips(raw)).max())
+            passed = max_diff <= atol
+            ok &= passed
+            print(json.dumps({
+                'model': name, 'runtime': type(runtime).__name__,
+                'max_abs_diff': max_diff, 'max_trips_diff': trips_diff, 'ok': passed,
+            }))
+    return ok
+
+
+def _latency(fn, batch: np.ndarray, repeat: int) -> float:
+    fn(batch)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(batch)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def bench(names: list[str], batch_sizes: list[int], repeat: int) -> None:
+    for name in names:
+        keras_path, _, _ = _paths(name)
+        runtimes = [LSTM(keras_path), NumpyLSTM(keras_path), FusedLSTM(keras_path)]
+        for batch_size in batch_sizes:
+            raw = _sample(runtimes[0], batch_size)
+            timings = {type(r).__name__: _latency(r.predict_trips, raw, repeat) for r in runtimes}
+            print(json.dumps({
+                'model': name,
+                'batch': batch_size,
+                **{f'{runtime}_ms': round(ms, 2) for runtime, ms in timings.items()},
+                'speedup': round(timings['LSTM'] / timings['FusedLSTM'], 1),
+            }))
+
+
+def incremental(names: list[str], data_path: str, start: datetime, hours: int, resync: list[int]) -> None:
+    DataManager(data_path)
+    for name in names:
+        keras_path, _, _ = _paths(name)
+        model = FusedLSTM(keras_path)
+        for resync_steps in resync:
+            forecaster = IncrementalLSTM(model.model, resync_steps=resync_steps)
+            reports, elapsed = [], 0.0
+            for hour in range(hours):
+                target = start + timedelta(hours=hour)
+                started = time.perf_counter()
+                forecaster.forecast(target)
+                elapsed += time.perf_counter() - started
+                reports.append(forecaster.validate(target)[2])
+            reports = [r for r in reports if r['districts']]
+            mismatched = float(np.mean([r['mismatched_share'] for r in reports])) if reports else 0
+            print(json.dumps({
+                'model': name,
+                'resync_steps': resync_steps,
+                'hours': hours,
+                'forecast_ms_per_hour': round(elapsed / hours * 1000, 2),
+                'max_abs_diff': max((r['max_abs_diff'] for r in reports), default=0),
+                'max_trips_diff': max((r['max_trips_diff'] for r in reports), default=0),
+                'mismatched_share': round(mismatched, 4),
+                **forecaster.stats,
+            }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Экспорт LSTM в NumPy-рантайм, сверка и замеры')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export_cmd = sub.add_parser('export', help='.keras -> .npz и _fused.npz рядом с исходной моделью')
+    export_cmd.add_argument('models', nargs='*', default=LSTM_MODELS)
+
+    check_cmd = sub.add_parser('check', help='сравнить выходы Keras, NumPy- и fused-рантайма')
+    check_cmd.add_argument('models', nargs='*', default=LSTM_MODELS)
+    check_cmd.add_argument('--batch', type=int, default=64)
+    check_cmd.add_argument('--atol', type=float, default=1e-3)
+
+    bench_cmd = sub.add_parser('bench', help='задержка predict_trips для разных размеров пакета')
+    bench_cmd.add_argument('models', nargs='*', default=LSTM_MODELS)
+    bench_cmd.add_argument('--batch', type=int, nargs='+', default=[1, 8, 64])
+    bench_cmd.add_argument('--repeat', type=int, default=20)
+
+    incremental_cmd = sub.add_parser(
+        'incremental', help='сверить инкрементальный LSTM с полным окном на идущих подряд часах'
+    )
+    incremental_cmd.add_argument('models', nargs='*', default=LSTM_MODELS)
+    incremental_cmd.add_argument('--data', default=os.getenv('DATA_PATH', 'data/lstm_data_v2.csv'))
+    incremental_cmd.add_argument('--start', type=datetime.fromisoformat, default=datetime(2024, 3, 1))
+    incremental_cmd.add_argument('--hours', type=int, default=48)
+    incremental_cmd.add_argument('--resync', type=int, nargs='+', default=[0, 6, 24])
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export(args.models)
+    elif args.command == 'check':
+        raise SystemExit(0 if check(args.models, args.batch, args.atol) else 1)
+    elif args.command == 'incremental':
+        incremental(args.models, args.data, args.start, args.hours, args.resync)
+    else:
+        bench(args.models, args.batch, args.repeat)
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from services.core.cost_lut import COST_LUT_KNOTS, COST_LUT_TRIPS_MAX, CostLUT
+from services.core.ml_model import MLP, LookupMLP, ModelRegistry, NumpyMLP, _checksum, registry
+from services.forecast_manager import FORECAST_YEAR
+
+
+def _model_path() -> str:
+    _, path_name = registry['mlp']
+    return ModelRegistry._model_path('mlp', path_name)
+
+
+def _sample(model: MLP, rows: int, seed: int = 0) -> pd.DataFrame:
+    # Районы из обучающей выборки плюс заведомо неизвестный, числовые признаки в масштабе скейлера, часть пропусков
+    rng = np.random.default_rng(seed)
+    encoder = model.scaler_X.named_transformers_['cat']
+    numeric = model.scaler_X.named_transformers_['num']
+    scaler = numeric.named_steps['scaler']
+    columns = list(model.scaler_X.transformers_[1][2])
+
+    values = scaler.mean_ + scaler.scale_ * rng.standard_normal((rows, len(columns)))
+    values[rng.random(values.shape) < 0.02] = np.nan
+    frame = pd.DataFrame(values, columns=columns)
+    locations = np.append(encoder.categories_[0], -1)
+    frame.insert(0, 'location_id', rng.choice(locations, size=rows))
+    return frame
+
+
+def check(rows: int, atol: float) -> bool:
+    path = _model_path()
+    reference, fast = MLP(path), NumpyMLP(path)
+    features = _sample(reference, rows)
+    expected = reference.model.predict(reference.scaler_X.transform(features))
+    actual = fast.compiled(features)
+    max_diff = float(np.abs(expected - actual).max())
+    cost_mismatch = int(np.sum(np.array(reference.predict_batch(features)) != np.array(fast.predict_batch(features))))
+    passed = max_diff <= atol
+    print(json.dumps({'rows': rows, 'max_abs_diff': max_diff, 'rounded_mismatch': cost_mismatch, 'ok': passed}))
+    return passed
+
+
+def bench(batch_sizes: list[int], repeat: int) -> None:
+    path = _model_path()
+    reference, fast = MLP(path), NumpyMLP(path)
+    for batch_size in batch_sizes:
+        features = _sample(reference, batch_size)
+        timings = {}
+        for model in (reference, fast):
+            model.predict_batch(features)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                model.predict_batch(features)
+            timings[type(model).__name__] = (time.perf_counter() - started) / repeat * 1000
+        print(json.dumps({
+            'batch': batch_size,
+            **{f'{name}_ms': round(ms, 3) for name, ms in timings.items()},
+            'speedup': round(timings['MLP'] / timings['NumpyMLP'], 1),
+        }))
+
+
+def build_lut(year: int, knots: int, trips_max: float, samples: int) -> None:
+    path = _model_path()
+    fast = NumpyMLP(path)
+    started = time.perf_counter()
+    lut = CostLUT.build(fast.compiled, year, trips_max=trips_max, knots=knots)
+    built = time.perf_counter() - started
+    report = lut.evaluate(fast.compiled, samples=samples)
+    lut_path = os.path.join(os.path.dirname(path), 'cost_lut')
+    lut.save(lut_path, source=_checksum(MLP.artifacts(path)))
+    print(json.dumps({
+        'path': lut_path,
+        'shape': list(lut.table.shape),
+        'size_mb': round(lut.table.nbytes / 2 ** 20, 1),
+        'build_s': round(built, 1),
+        **report,
+    }))
+
+
+def bench_costs(repeat: int) -> None:
+    path = _model_path()
+    exact, lut = NumpyMLP(path), LookupMLP(path)
+    district = int(exact.compiled.categories[0])
+    start_time, trips = datetime(FORECAST_YEAR, 3, 5, 10), list(range(100, 124))
+    for model in (exact, lut):
+        model.predict_costs(district, start_time, trips)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            model.predict_costs(district, start_time, trips)
+        elapsed_ms = (time.perf_counter() - started) / repeat * 1000
+        print(json.dumps({'runtime': type(model).__name__, 'predict_costs_ms': round(elapsed_ms, 3)}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сверка и замеры NumPy-версии модели стоимости')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    check_cmd = sub.add_parser('check', help='сравнить NumPy-версию с joblib-пайплайном')
+    check_cmd.add_argument('--rows', type=int, default=10000)
+    check_cmd.add_argument('--atol', type=float, default=1e-3)
+
+    bench_cmd = sub.add_parser('bench', help='задержка predict_batch для разных размеров пакета')
+    bench_cmd.add_argument('--batch', type=int, nargs='+', default=[1, 24, 1000])
+    bench_cmd.add_argument('--repeat', type=int, default=50)
+
+    lut_cmd = sub.add_parser('lut', help='построить таблицу стоимостей и отчёт об ошибке относительно модели')
+    lut_cmd.add_argument('--year', type=int, default=FORECAST_YEAR)
+    lut_cmd.add_argument('--knots', type=int, default=COST_LUT_KNOTS)
+    lut_cmd.add_argument('--trips-max', type=float, default=COST_LUT_TRIPS_MAX)
+    lut_cmd.add_argument('--samples', type=int, default=100000)
+
+    bench_costs_cmd = sub.add_parser('bench-costs', help='задержка predict_costs на 24 часа: модель против таблицы')
+    bench_costs_cmd.add_argument('--repeat', type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == 'check':
+        raise SystemExit(0 if check(args.rows, args.atol) else 1)
+    elif args.command == 'lut':
+        build_lut(args.year, args.knots, args.trips_max, args.samples)
+    elif args.command == 'bench-costs':
+        bench_costs(args.repeat)
+    else:
+        bench(args.batch, args.repeat)
@@ -1,11 +1,142 @@
 import json
+import logging
+import os
+import queue
+import threading
+import time
 from datetime import timedelta
+from typing import Optional
 
 import pika
 from db.db import get_session
 from db.models.prediction import Prediction
-from services.user_manager import UserManager
-from workers.connection import QUEUE_NAME, get_rabbitmq_connection
+from pika import BlockingConnection
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import AMQPError
+from services.user_manager import STATUS_PRICES, UserManager
+from workers.connection import QUEUE_MAX_PRIORITY, QUEUE_NAME, get_rabbitmq_connection
+
+RABBITMQ_PUBLISH_CHANNELS = int(os.getenv('RABBITMQ_PUBLISH_CHANNELS', 8))
+RABBITMQ_PUBLISH_TIMEOUT_SECONDS = float(os.getenv('RABBITMQ_PUBLISH_TIMEOUT_SECONDS', 10))
+RABBITMQ_CONFIRM_DELIVERY = os.getenv('RABBITMQ_CONFIRM_DELIVERY', '1') == '1'
+
+PooledChannel = tuple[BlockingConnection, BlockingChannel]
+
+
+class TaskPublisher:
+    # Долгоживущие соединения с RabbitMQ на весь процесс API: очередь объявляется один раз при подключении,
+    # а не на каждый запрос. BlockingConnection не потокобезопасен, поэтому у каждого канала своё соединение,
+    # и поток берёт канал из пула только на время публикации
+    def __init__(self, size: int = RABBITMQ_PUBLISH_CHANNELS, confirm: bool = RABBITMQ_CONFIRM_DELIVERY,
+                 timeout: float = RABBITMQ_PUBLISH_TIMEOUT_SECONDS):
+        self.size = size
+        self.confirm = confirm
+        self.timeout = timeout
+        self.connects = 0
+        self._idle: queue.LifoQueue[Optional[PooledChannel]] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(None)
+
+    def publish(self, payload: dict, routing_key: str = QUEUE_NAME) -> None:
+        body = json.dumps(payload)
+        for attempt in range(2):
+            pooled = self._acquire()
+            try:
+                # С подтверждениями basic_publish возвращается только после ack брокера:
+                # сообщение уже записано в durable-очередь
+                pooled[1].basic_publish(
+                    exchange='',
+                    routing_key=routing_key,
+                    body=body,
+                    properties=pika.BasicProperties(delivery_mode=2, priority=payload.get('priority')),
+                )
+            except AMQPError as e:
+                # Соединение оборвалось (рестарт брокера, пропущенные heartbeat) или брокер не подтвердил
+                # сообщение: выбрасываем соединение и повторяем один раз на новом
+                self._discard(pooled)
+                if attempt:
+                    raise
+                logging.warning(f'Публикация в RabbitMQ не удалась, переподключаемся: {type(e).__name__}: {e}')
+                continue
+            self._idle.put(pooled)
+            return
+
+    def close(self) -> None:
+        # Забираем все слоты, чтобы не закрыть соединение посреди чужой публикации
+        with self._lock:
+            for _ in range(self.size):
+                try:
+                    pooled = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    break
+                if pooled is not None:
+                    self._close(pooled)
+            for _ in range(self.size):
+                self._idle.put(None)
+
+    def _acquire(self) -> PooledChannel:
+        try:
+            pooled = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f'Нет свободного канала RabbitMQ за {self.timeout} с')
+        if pooled is not None and pooled[0].is_open and pooled[1].is_open:
+            return pooled
+        if pooled is not None:
+            self._close(pooled)
+        try:
+            return self._connect()
+        except Exception:
+            self._idle.put(None)
+            raise
+
+    def _connect(self) -> PooledChannel:
+        connection, channel, _ = get_rabbitmq_connection()
+        if self.confirm:
+            channel.confirm_delivery()
+        self.connects += 1
+        return connection, channel
+
+    def _discard(self, pooled: PooledChannel) -> None:
+        self._close(pooled)
+        self._idle.put(None)
+
+    @staticmethod
+    def _close(pooled: PooledChannel) -> None:
+        try:
+            pooled[0].close()
+        except Exception:
+            pass
+
+
+task_publisher = TaskPublisher()
+
+
+def task_priority(status: str, paid: bool) -> int:
+    # Уровень статуса по цене из STATUS_PRICES, внутри уровня платный запрос выше бесплатного:
+    # bronze 0/1, silver 2/3, gold 4/5, diamond 6/7
+    tiers = sorted(STATUS_PRICES, key=STATUS_PRICES.get)
+    rank = tiers.index(status) if status in tiers else 0
+    return min(2 * rank + int(paid), QUEUE_MAX_PRIORITY)
+
+
+def task_payload(pred: Prediction, status: str) -> dict:
+    timestamp = pred.timestamp + timedelta(hours=1)
+    return {
+        'prediction_id': pred.id,
+        'user_id': pred.user_id,
+        'model': pred.model,
+        'district': pred.district,
+        'hour': pred.hour,
+        'city': pred.city,
+        'cost': pred.cost,
+        'year': timestamp.year,
+        'month': timestamp.month,
+        'day': timestamp.day,
+        'tier': status,
+        'priority': task_priority(status, pred.cost > 0),
+        'enqueued_at': time.time(),
+    }
 
 
 def publish_prediction_task(
@@ -22,30 +153,9 @@ def publish_prediction_task(
             district=district,
             hour=hour,
         )
+        payload = task_payload(pred, um.user.status)
 
-        timestamp = pred.timestamp + timedelta(hours=1)
-
-        payload = {
-            'prediction_id': pred.id,
-            'user_id': user_id,
-            'model': model,
-            'district': district,
-            'hour': hour,
-            'city': city,
-            'cost': cost,
-            'year': timestamp.year,
-            'month': timestamp.month,
-            'day': timestamp.day
-        }
-
-    conn, chan, name = get_rabbitmq_connection()
-    chan.basic_publish(
-        exchange='',
-        routing_key=QUEUE_NAME,
-        body=json.dumps(payload),
-        properties=pika.BasicProperties(delivery_mode=2),
-    )
-    conn.close()
+    task_publisher.publish(payload)
     print(f'[x] Задача предсказания отправлена: {payload}')
 
     return pred
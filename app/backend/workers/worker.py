@@ -1,22 +1,34 @@
+import asyncio
+import hashlib
 import json
 import logging
-import math
 import os
+import signal
+import sys
 import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
-from typing import Any
+from typing import Any, Optional
 
-import numpy as np
-from db.db import get_session
+import aio_pika
+from db.db import get_session, init_db
+from db.models.prediction import Prediction
 from pika.adapters.blocking_connection import BlockingChannel
 from pika.spec import BasicProperties
 from services.core.enums import TaskStatus
 from services.core.ml_model import ModelRegistry
-from services.data_manager import DataManager
+from services.fair_scheduler import FairScheduler
+from services.forecast_cache import CacheKey, ForecastCache
+from services.forecast_manager import ForecastManager, forecast_target, next_hour_target
+from services.inference import LocalInference, RemoteInference
+from services.lease_manager import LeaseManager
+from services.tier_latency import TierLatency
 from services.user_manager import UserManager
-from sklearn.preprocessing import StandardScaler
-from workers.connection import get_rabbitmq_connection
+from sqlmodel import Session
+from threadpoolctl import threadpool_limits
+from workers.connection import QUEUE_NAME, RABBITMQ_HOST, declare_task_queue, get_rabbitmq_connection
 
 LOGDIR = os.getenv('LOG_DIR', '/logs')
 os.makedirs(LOGDIR, exist_ok=True)
@@ -26,59 +38,261 @@ logging.basicConfig(
     format='%(asctime)s %(levelname)s %(message)s'
 )
 
-data = DataManager('data/lstm_data_v2.csv')
+BATCH_SIZE = max(1, int(os.getenv('WORKER_BATCH_SIZE', 1)))
+BATCH_TIMEOUT_MS = int(os.getenv('WORKER_BATCH_TIMEOUT_MS', 50))
+WEATHER_REFRESH_SECONDS = int(os.getenv('WEATHER_REFRESH_SECONDS', 3600))
+DATA_PATH = os.getenv('DATA_PATH', 'data/lstm_data_v2.csv')
+DATA_REFRESH_SECONDS = int(os.getenv('DATA_REFRESH_SECONDS', 60))
+COALESCE_WAIT_SECONDS = float(os.getenv('COALESCE_WAIT_SECONDS', 5))
+COALESCE_POLL_SECONDS = float(os.getenv('COALESCE_POLL_SECONDS', 0.1))
+LEASE_PURGE_SECONDS = int(os.getenv('LEASE_PURGE_SECONDS', 600))
+PRECOMPUTE_MODELS = [m for m in os.getenv('PRECOMPUTE_MODELS', 'lstmv3').split(',') if m]
+PRECOMPUTE_DELAY_SECONDS = int(os.getenv('PRECOMPUTE_DELAY_SECONDS', 5))
+MODEL_WATCH_SECONDS = int(os.getenv('MODEL_WATCH_SECONDS', 60))
+READY_FILE = os.getenv('WORKER_READY_FILE', '/tmp/worker.ready')
+INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET', '')
+WORKER_PROCESSES = max(1, int(os.getenv('WORKER_PROCESSES', 1)))
+WORKER_THREADS = max(1, int(os.getenv('WORKER_THREADS') or (os.cpu_count() or 1) // WORKER_PROCESSES))
+WORKER_RESTART_DELAY_SECONDS = float(os.getenv('WORKER_RESTART_DELAY_SECONDS', 1))
+WORKER_MODE = os.getenv('WORKER_MODE', 'blocking')
+WORKER_CONCURRENCY = max(1, int(os.getenv('WORKER_CONCURRENCY', 4)))
+TIER_REPORT_SECONDS = int(os.getenv('TIER_REPORT_SECONDS', 60))
+FAIR_BUFFER = max(0, int(os.getenv('WORKER_FAIR_BUFFER', 16)))
 
-def post_process(
-    y_pred_s: np.ndarray,
-    scaler_y: StandardScaler,
-) -> list[int]:
-    y = y_pred_s.copy()
-    y = scaler_y.inverse_transform(y.reshape(-1, 1)).reshape(y.shape)
-    y = np.clip(y, 0, None)
-    return [math.ceil(el) for el in y]
+# С INFERENCE_SOCKET модели и датасет живут в workers/inference_server.py, воркер только разбирает очередь
+engine = RemoteInference(INFERENCE_SOCKET) if INFERENCE_SOCKET else LocalInference(DATA_PATH)
+forecast_cache = ForecastCache()
+ModelRegistry.on_reload(forecast_cache.clear)
+engine.on_data_change(forecast_cache.clear)
+stop_event = threading.Event()
+tier_latency = TierLatency()
 
-def process_prediction(task_data: dict[str, Any]) -> None:
-    with next(get_session()) as session:
-        um = UserManager(session, task_data['user_id'])
-        pred = um.prediction.get_by_id(task_data['prediction_id'])
+Job = tuple[dict[str, Any], UserManager, Prediction]
+
+
+def _target_datetime(task_data: dict[str, Any]) -> datetime:
+    return forecast_target(task_data['month'], task_data['day'], task_data['hour'])
+
+
+def _cache_key(version: str, task_data: dict[str, Any]) -> CacheKey:
+    return version, task_data['district'], _target_datetime(task_data)
+
+
+def _fail(session: Session, pred: Prediction, error: Exception) -> None:
+    logging.exception(f'Ошибка обработки предсказания: ID {pred.id}, {error}')
+    pred.status = TaskStatus.FAILED
+    pred.timestamp = datetime.now(UTC)
+    session.commit()
+
+
+def _lease_key(key: CacheKey, data_version: Optional[str]) -> str:
+    # Результаты в forecastlease живут COALESCE_RESULT_SECONDS: после переключения датасета
+    # ключ должен смениться, иначе реплики раздавали бы прогноз по старым данным
+    version, district, target_datetime = key
+    data = hashlib.sha1(str(data_version).encode()).hexdigest()[:8]
+    return f'{version}:{data}:{district}:{target_datetime:%Y%m%d%H}'
+
+
+def _complete(
+    session: Session,
+    task_data: dict[str, Any],
+    um: UserManager,
+    pred: Prediction,
+    res: list[int],
+    trip_costs: Optional[list[float]] = None,
+    model_version: Optional[str] = None,
+) -> None:
+    try:
+        pred.result = str(res)
+        pred.model_version = model_version
+        if task_data['cost'] > 0:
+            pred.trip_costs = str(trip_costs)
+
+        pred.timestamp = datetime.now(UTC)
+        pred.status = TaskStatus.COMPLETED
+        session.commit()
+        if task_data['cost'] != 0:
+            um.balance.withdraw(task_data['cost'], description='Оплата предсказания')
+
+        logging.info(f'✅ Предсказание выполнено: ID {task_data["prediction_id"]}, результат: {pred.result}')
+
+    except Exception as e:
+        _fail(session, pred, e)
+
+
+def _fan_out(
+    session: Session,
+    key: CacheKey,
+    jobs: list[Job],
+    res: list[int],
+    trip_costs: Optional[list[float]] = None,
+) -> Optional[list[float]]:
+    error = None
+    if trip_costs is None and any(task_data['cost'] > 0 for task_data, _, _ in jobs):
+        try:
+            trip_costs = engine.costs(key[1], key[2], res)
+        except Exception as e:
+            error = e
+    forecast_cache.put(key, res, trip_costs)
+
+    for task_data, um, pred in jobs:
+        if task_data['cost'] > 0 and error is not None:
+            _fail(session, pred, error)
+        else:
+            _complete(session, task_data, um, pred, res, trip_costs, model_version=key[0])
+    return trip_costs
+
+
+def _infer(
+    session: Session,
+    leases: LeaseManager,
+    model_name: str,
+    pending: dict[CacheKey, list[Job]],
+    data_version: Optional[str],
+) -> None:
+    by_target: dict[datetime, list[CacheKey]] = defaultdict(list)
+    for key in pending:
+        by_target[key[2]].append(key)
+
+    keys, results = [], []
+    for target, target_keys in by_target.items():
         try:
+            _, ids, target_results = engine.forecast(model_name, target, [key[1] for key in target_keys])
+            by_district = dict(zip(ids, target_results))
+            error = None
+        except Exception as e:
+            by_district, error = {}, e
+        for key in target_keys:
+            if key[1] in by_district:
+                keys.append(key)
+                results.append(by_district[key[1]])
+                continue
+            leases.release(_lease_key(key, data_version))
+            for _, _, pred in pending[key]:
+                _fail(session, pred, error or ValueError(f'Нет данных для района={key[1]} до {target}'))
+    if not keys:
+        return
+
+    logging.info(
+        f'Пакетный инференс {keys[0][0]}: {len(keys)} прогнозов для '
+        f'{sum(len(pending[key]) for key in keys)} задач, кэш: {forecast_cache.stats()}'
+    )
+    for key, res in zip(keys, results):
+        trip_costs = _fan_out(session, key, pending[key], res)
+        leases.publish(_lease_key(key, data_version), res, trip_costs)
+
+
+def _coalesce(session: Session, model_name: str, pending: dict[CacheKey, list[Job]]) -> None:
+    leases = LeaseManager(session)
+    data_version = engine.data_version()
+    owned: dict[CacheKey, list[Job]] = {}
+    waiting: dict[CacheKey, list[Job]] = {}
+    for key, jobs in pending.items():
+        shared = leases.get_result(_lease_key(key, data_version))
+        if shared is not None:
+            _fan_out(session, key, jobs, *shared)
+        elif leases.acquire(_lease_key(key, data_version)):
+            owned[key] = jobs
+        else:
+            waiting[key] = jobs
+
+    _infer(session, leases, model_name, owned, data_version)
+
+    # Остальные прогнозы сейчас считает другая реплика: ждём её результат, но не дольше COALESCE_WAIT_SECONDS
+    deadline = time.monotonic() + COALESCE_WAIT_SECONDS
+    while waiting and time.monotonic() < deadline:
+        time.sleep(COALESCE_POLL_SECONDS)
+        for key in list(waiting):
+            shared = leases.get_result(_lease_key(key, data_version))
+            if shared is not None:
+                _fan_out(session, key, waiting.pop(key), *shared)
+
+    if waiting:
+        logging.warning(f'Не дождались результата другой реплики для {len(waiting)} прогнозов, считаем сами')
+        _infer(session, leases, model_name, waiting, data_version)
+
+
+def process_batch(tasks: list[dict[str, Any]]) -> None:
+    with next(get_session()) as session:
+        groups: dict[str, list[Job]] = defaultdict(list)
+        for task_data in tasks:
+            um = UserManager(session, task_data['user_id'])
+            pred = um.prediction.get_by_id(task_data['prediction_id'])
+            if pred is None:
+                logging.warning(f'Предсказание не найдено: ID {task_data["prediction_id"]}')
+                continue
+            if pred.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                # Повторная доставка (переотправка после обрыва или requeue): результат уже записан
+                logging.info(f'Предсказание {pred.id} уже обработано, пропускаем повтор')
+                continue
             pred.status = TaskStatus.PROCESSING
             pred.timestamp = datetime.now(UTC)
-            session.commit()
+            groups[task_data['model']].append((task_data, um, pred))
+        session.commit()
+        claimed = [job[0] for jobs in groups.values() for job in jobs]
 
-            model = ModelRegistry.get(task_data['model'])
-            target_datetime = datetime(2024,  task_data['month'], task_data['day'], task_data['hour'])
-            sequence = data.create_single_sequence(target_datetime, task_data['district'], model.scaler_X)
+        for model_name, jobs in groups.items():
+            try:
+                version = engine.version(model_name)
+            except Exception as e:
+                for _, _, pred in jobs:
+                    _fail(session, pred, e)
+                continue
 
-            result = model.predict(sequence)
+            # Одинаковые (модель, район, дата, час) считаем один раз и раздаём результат всем задачам
+            pending: dict[CacheKey, list[Job]] = defaultdict(list)
+            for job in jobs:
+                pending[_cache_key(version, job[0])].append(job)
 
-            res = post_process(result, model.scaler_y)
-            pred.result = str(res)
+            for key in list(pending):
+                cached = forecast_cache.get(key)
+                if cached is not None:
+                    _fan_out(session, key, pending.pop(key), cached.result, cached.trip_costs)
+            if pending:
+                _coalesce(session, model_name, pending)
 
-            if task_data['cost'] > 0:
-                date = target_datetime
-                trip_costs = []
-                model_cost = ModelRegistry.get('mlp')
-                for el in res:
-                    seq = data.create_feature_vector(task_data['district'], date, date.hour, el)
-                    cost = model_cost.predict(seq)
-                    trip_costs.append(cost)
-                    date += timedelta(hours=1)
-                pred.trip_costs = str(trip_costs)
+    finished = time.time()
+    for task_data in claimed:
+        if 'enqueued_at' in task_data:
+            tier_latency.observe(task_data.get('tier', 'bronze'), finished - task_data['enqueued_at'])
 
-            pred.timestamp = datetime.now(UTC)
-            pred.status = TaskStatus.COMPLETED
-            session.commit()
-            if task_data['cost'] != 0:
-                um.balance.withdraw(task_data['cost'], description='Оплата предсказания')
 
-            logging.info(f'✅ Предсказание выполнено: ID {task_data["prediction_id"]}, результат: {pred.result}')
+def precompute_forecasts(model_name: str, target: datetime) -> int:
+    with next(get_session()) as session:
+        leases = LeaseManager(session)
+        lease_key = f'precompute:{model_name}:{target:%Y%m%d%H}'
+        if not leases.acquire(lease_key):
+            return 0
+        try:
+            version, districts, results = engine.forecast(model_name, target)
+            trip_costs = [engine.costs(d, target, res) for d, res in zip(districts, results)]
 
-        except Exception as e:
-            logging.exception(f'Ошибка обработки предсказания: {e}')
-            pred.status = TaskStatus.FAILED
-            pred.timestamp = datetime.now(UTC)
-            session.commit()
+            ForecastManager(session).save(model_name, version, target, districts, results, trip_costs)
+            for district, res, district_costs in zip(districts, results, trip_costs):
+                forecast_cache.put((version, district, target), res, district_costs)
+        except Exception:
+            leases.release(lease_key)
+            raise
+        leases.publish(lease_key, [len(districts)])
+        return len(districts)
+
+
+def warm_up() -> float:
+    # Первые задачи не должны платить за загрузку моделей, ленивую инициализацию и подкачку страниц датасета
+    started = time.perf_counter()
+    if os.path.exists(READY_FILE):
+        os.remove(READY_FILE)
+    stats = engine.warm(batch_sizes=tuple(sorted({1, BATCH_SIZE})), full_batch_models=tuple(PRECOMPUTE_MODELS))
+    elapsed = time.perf_counter() - started
+
+    with open(READY_FILE, 'w') as f:
+        f.write(datetime.now(UTC).isoformat())
+    logging.info(f'🔥 Прогрев воркера за {elapsed:.2f} с: {stats}')
+    return elapsed
+
+
+def process_prediction(task_data: dict[str, Any]) -> None:
+    process_batch([task_data])
 
 
 def callback(
@@ -87,46 +301,441 @@ def callback(
     properties: BasicProperties,
     body: bytes
 ) -> None:
-    task_data = json.loads(body)
-    logging.info(f'📩 Получено сообщение: {task_data}')
-    process_prediction(task_data)
+    try:
+        task_data = json.loads(body)
+        logging.info(f'📩 Получено сообщение: {task_data}')
+        process_prediction(task_data)
+    except Exception as e:
+        # Например, недоступна БД: задача не записана, возвращаем сообщение в очередь (повторная доставка одна)
+        logging.exception(f'Ошибка при обработке сообщения: {e}')
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+        return
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 
+def _fair_key(body: bytes) -> tuple[Any, float]:
+    # Ключ и вес для FairScheduler: задачи одного пользователя в одной очереди, уровень статуса даёт вес.
+    # Без WORKER_FAIR_BUFFER все сообщения в одной очереди, то есть в порядке получения
+    if not FAIR_BUFFER:
+        return None, 1.0
+    try:
+        task_data = json.loads(body)
+    except ValueError:
+        return None, 1.0
+    return task_data.get('user_id'), 1.0 + task_data.get('priority', 0)
+
+
 def start_worker() -> None:
+    if WORKER_MODE == 'asyncio':
+        start_async_worker()
+        return
+    if BATCH_SIZE == 1 and not FAIR_BUFFER:
+        start_single_worker()
+        return
+
+    try:
+        connection, channel, queue = get_rabbitmq_connection()
+        # Сверх пакета берём FAIR_BUFFER сообщений, чтобы планировщику было из чего выбирать
+        channel.basic_qos(prefetch_count=BATCH_SIZE + FAIR_BUFFER)
+
+        buffer: FairScheduler[tuple[Any, bytes]] = FairScheduler()
+
+        def buffer_message(
+            ch: BlockingChannel,
+            method: Any,
+            properties: BasicProperties,
+            body: bytes
+        ) -> None:
+            key, weight = _fair_key(body)
+            buffer.push(key, (method, body), weight=weight)
+
+        channel.basic_consume(queue=queue, on_message_callback=buffer_message)
+
+        logging.info(
+            f'[Worker запущен и ожидает сообщений (пакет до {BATCH_SIZE}, ожидание {BATCH_TIMEOUT_MS} мс, '
+            f'буфер планировщика {FAIR_BUFFER})...'
+        )
+        while not stop_event.is_set():
+            # Пока буфер не пуст, только забираем пришедшие сообщения и не ждём новых
+            connection.process_data_events(time_limit=0 if buffer else 1)
+            if not buffer:
+                continue
+
+            deadline = time.monotonic() + BATCH_TIMEOUT_MS / 1000
+            while len(buffer) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                connection.process_data_events(time_limit=remaining)
+
+            batch = buffer.take(BATCH_SIZE)
+            try:
+                tasks = [json.loads(body) for _, body in batch]
+                logging.info(f'📩 Получено сообщений: {len(tasks)}: {tasks}')
+                process_batch(tasks)
+                done = True
+            except Exception as e:
+                logging.exception(f'Ошибка при обработке пакета: {e}')
+                done = False
+
+            # Подтверждаем только после commit в process_batch, иначе возвращаем пакет в очередь
+            for method, _ in batch:
+                if done:
+                    channel.basic_ack(delivery_tag=method.delivery_tag)
+                else:
+                    channel.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+
+        # Неподтверждённые сообщения из буфера RabbitMQ вернёт в очередь после закрытия соединения
+        connection.close()
+
+    except Exception as e:
+        logging.exception(f'Worker завершился с ошибкой: {e}')
+
+
+async def consume_async(concurrency: int = WORKER_CONCURRENCY) -> None:
+    # Пакеты собираются так же, как в start_worker, но одновременно обрабатывается до concurrency пакетов
+    # в потоках executor: пока один ждёт БД или сервер инференса, другой считает модель (NumPy отпускает GIL).
+    # prefetch ограничивает число сообщений в памяти, семафор - число пакетов в работе
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='task')
+    semaphore = asyncio.Semaphore(concurrency)
+    buffer: FairScheduler[aio_pika.abc.AbstractIncomingMessage] = FairScheduler()
+    arrived = asyncio.Event()
+    in_flight: set[asyncio.Task] = set()
+
+    async def receive(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+        key, weight = _fair_key(message.body)
+        buffer.push(key, message, weight=weight)
+        arrived.set()
+
+    async def wait_for_messages(count: int, timeout: float) -> bool:
+        deadline = loop.time() + timeout
+        while len(buffer) < count:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            arrived.clear()
+            try:
+                await asyncio.wait_for(arrived.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+        return len(buffer) > 0
+
+    async def run(batch: list[aio_pika.abc.AbstractIncomingMessage]) -> None:
+        try:
+            tasks = [json.loads(message.body) for message in batch]
+            logging.info(f'📩 Получено сообщений: {len(tasks)}: {tasks}')
+            await loop.run_in_executor(executor, process_batch, tasks)
+            done = True
+        except Exception as e:
+            logging.exception(f'Ошибка при обработке пакета: {e}')
+            done = False
+        finally:
+            semaphore.release()
+
+        try:
+            for message in batch:
+                if done:
+                    await message.ack()
+                else:
+                    # Повторная доставка одна: сообщение, упавшее дважды, не должно крутиться в очереди бесконечно
+                    await message.nack(requeue=not message.redelivered)
+        except Exception as e:
+            # Канал переоткрылся после обрыва: RabbitMQ доставит сообщения снова, готовые задачи воркер пропустит
+            logging.warning(f'Не удалось подтвердить сообщения пакета: {type(e).__name__}: {e}')
+
+    connection = await aio_pika.connect_robust(host=RABBITMQ_HOST)
+    try:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=concurrency * BATCH_SIZE + FAIR_BUFFER)
+        await declare_task_queue(connection)
+        queue = await channel.get_queue(QUEUE_NAME, ensure=False)
+        consumer_tag = await queue.consume(receive)
+        logging.info(
+            f'[Worker (asyncio) запущен: до {concurrency} пакетов по {BATCH_SIZE} сообщений, '
+            f'ожидание {BATCH_TIMEOUT_MS} мс]'
+        )
+
+        while not stop_event.is_set():
+            # Пока все слоты заняты, сообщения копятся в буфере, и планировщик выбирает из них по пользователям
+            await semaphore.acquire()
+            if not await wait_for_messages(1, timeout=1):
+                semaphore.release()
+                continue
+            await wait_for_messages(BATCH_SIZE, timeout=BATCH_TIMEOUT_MS / 1000)
+            task = asyncio.create_task(run(buffer.take(BATCH_SIZE)))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        # Новые сообщения больше не берём, начатые пакеты дорабатываем и подтверждаем.
+        # Полученные, но не начатые сообщения RabbitMQ вернёт в очередь после закрытия канала
+        await queue.cancel(consumer_tag)
+        if in_flight:
+            logging.info(f'Остановка: дорабатываем {len(in_flight)} пакетов')
+            await asyncio.gather(*in_flight)
+    finally:
+        await connection.close()
+        executor.shutdown(wait=True)
+
+
+def start_async_worker() -> None:
+    try:
+        asyncio.run(consume_async())
+    except Exception as e:
+        logging.exception(f'Worker завершился с ошибкой: {e}')
+
+
+def start_single_worker() -> None:
     try:
         connection, channel, queue = get_rabbitmq_connection()
         channel.basic_qos(prefetch_count=1)
         channel.basic_consume(queue=queue, on_message_callback=callback)
 
         logging.info('[Worker запущен и ожидает сообщений...')
-        channel.start_consuming()
+        while not stop_event.is_set():
+            connection.process_data_events(time_limit=1)
+        connection.close()
 
     except Exception as e:
         logging.exception(f'Worker завершился с ошибкой: {e}')
 
 
-def daily_reload() -> None:
+def model_watch() -> None:
     while True:
-        now = datetime.now(UTC)
-        tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        delay = (tomorrow - now).total_seconds()
-        time.sleep(delay)
+        time.sleep(MODEL_WATCH_SECONDS)
         try:
-            ModelRegistry.reload_all()
-            logging.info('🔄 Модели перезагружены в воркере')
+            reloaded = engine.reload_models()
+            if reloaded:
+                versions = ', '.join(ModelRegistry.get(name).version for name in reloaded)
+                logging.info(f'🔄 Модели перезагружены в воркере: {versions}, {ModelRegistry.stats()}')
         except Exception as e:
             logging.exception(f'Ошибка при перезагрузке моделей: {e}')
 
 
+def weather_refresh() -> None:
+    while True:
+        time.sleep(WEATHER_REFRESH_SECONDS)
+        try:
+            engine.refresh_weather()
+        except Exception as e:
+            logging.exception(f'Ошибка при обновлении погоды: {e}')
+
+
+def dataset_refresh() -> None:
+    while True:
+        time.sleep(DATA_REFRESH_SECONDS)
+        try:
+            if engine.refresh_data():
+                logging.info(f'🔄 Датасет переключён на {engine.data_version()}')
+        except Exception as e:
+            logging.exception(f'Ошибка при переключении датасета: {e}')
+
+
+def lease_purge() -> None:
+    while True:
+        time.sleep(LEASE_PURGE_SECONDS)
+        try:
+            with next(get_session()) as session:
+                removed = LeaseManager(session).purge_expired()
+            if removed:
+                logging.info(f'🧹 Удалено устаревших аренд прогнозов: {removed}')
+        except Exception as e:
+            logging.exception(f'Ошибка при очистке аренд прогнозов: {e}')
+
+
+def tier_report() -> None:
+    while True:
+        time.sleep(TIER_REPORT_SECONDS)
+        report = tier_latency.report()
+        if not report:
+            continue
+        logging.info(f'⏱ Задержка задач по уровням: {report}')
+        for tier, stats in report.items():
+            if not stats['ok']:
+                logging.warning(f'⏱ SLO уровня {tier} нарушен: p95 {stats["p95"]} с > {stats["slo"]} с')
+
+
+def hourly_precompute() -> None:
+    while True:
+        target = next_hour_target()
+        for model_name in PRECOMPUTE_MODELS:
+            try:
+                started = time.perf_counter()
+                count = precompute_forecasts(model_name, target)
+                if count:
+                    logging.info(
+                        f'🗓 Прогнозы {model_name} на {target} посчитаны для {count} районов '
+                        f'за {time.perf_counter() - started:.2f} с'
+                    )
+            except Exception as e:
+                logging.exception(f'Ошибка при предрасчёте прогнозов {model_name}: {e}')
+
+        now = datetime.now(UTC)
+        next_run = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        time.sleep((next_run - now).total_seconds() + PRECOMPUTE_DELAY_SECONDS)
+
+
+def _limit_threads() -> None:
+    # Потоки TensorFlow настраиваются до его импорта, потоки BLAS (NumPy-рантаймы) - в каждом процессе
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(WORKER_THREADS))
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+    threadpool_limits(limits=WORKER_THREADS)
+
+
+def _run_child(slot: int) -> None:
+    from db.db import engine as db_engine
+
+    # Соединения пула SQLAlchemy остались от родителя: дочерний процесс открывает свои
+    db_engine.dispose(close=False)
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _limit_threads()
+
+    if isinstance(engine, LocalInference):
+        threading.Thread(target=weather_refresh, daemon=True).start()
+    threading.Thread(target=tier_report, daemon=True).start()
+    if slot == 0:
+        threading.Thread(target=lease_purge, daemon=True).start()
+        threading.Thread(target=hourly_precompute, daemon=True).start()
+    start_worker()
+
+
+def _spawn(slot: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    code = 0
+    try:
+        _run_child(slot)
+        # Без SIGTERM start_worker возвращается только после ошибки
+        code = 0 if stop_event.is_set() else 1
+    except BaseException as e:
+        logging.exception(f'Процесс воркера {slot} завершился с ошибкой: {e}')
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+def start_pool(processes: int) -> None:
+    # Модели и датасет загружены до fork, поэтому дочерние процессы делят их страницы (copy-on-write).
+    # Родитель не держит своих потоков: он только перезапускает упавшие процессы, следит за моделями и
+    # датасетом и при их обновлении по очереди перезапускает дочерние, чтобы они унаследовали новую версию
+    children: dict[int, int] = {}
+    started: dict[int, float] = {}
+    delays = {slot: WORKER_RESTART_DELAY_SECONDS for slot in range(processes)}
+    respawn_at = {slot: 0.0 for slot in range(processes)}
+    recycle: list[int] = []
+    recycling: Optional[int] = None
+    stopping = False
+
+    def stop(*_) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    next_watch = time.monotonic() + MODEL_WATCH_SECONDS
+    next_data = time.monotonic() + DATA_REFRESH_SECONDS
+    logging.info(f'Запуск {processes} процессов воркера по {WORKER_THREADS} потоков')
+
+    while children or not stopping:
+        now = time.monotonic()
+        for slot, when in list(respawn_at.items()):
+            if not stopping and now >= when:
+                pid = _spawn(slot)
+                children[pid] = slot
+                started[slot] = now
+                del respawn_at[slot]
+                logging.info(f'Процесс воркера {slot} запущен: PID {pid}')
+
+        pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+        if pid:
+            slot = children.pop(pid)
+            if pid == recycling:
+                recycling = None
+                delays[slot] = WORKER_RESTART_DELAY_SECONDS
+                respawn_at[slot] = now
+            elif not stopping:
+                # Процесс, упавший сразу после старта, перезапускаем с растущей задержкой
+                quick = now - started[slot] < 60
+                delays[slot] = min(delays[slot] * 2, 60) if quick else WORKER_RESTART_DELAY_SECONDS
+                respawn_at[slot] = now + delays[slot]
+                logging.warning(
+                    f'Процесс воркера {slot} (PID {pid}) завершился с кодом {os.waitstatus_to_exitcode(status)}, '
+                    f'перезапуск через {delays[slot]:.0f} с'
+                )
+            continue
+
+        if not stopping and isinstance(engine, LocalInference):
+            try:
+                changed = False
+                if now >= next_watch:
+                    next_watch = now + MODEL_WATCH_SECONDS
+                    changed |= bool(engine.reload_models())
+                if now >= next_data:
+                    next_data = now + DATA_REFRESH_SECONDS
+                    changed |= engine.refresh_data()
+                if changed:
+                    recycle = list(children)
+                    logging.info(f'🔄 Модели или датасет обновлены, перезапускаем процессы воркера: {recycle}')
+            except Exception as e:
+                logging.exception(f'Ошибка при обновлении моделей и датасета: {e}')
+
+        # Перезапуск по одному: следующий процесс останавливаем, когда все остальные работают
+        if not stopping and recycling is None and recycle and len(children) == processes:
+            pid = recycle.pop(0)
+            if pid in children:
+                recycling = pid
+                os.kill(pid, signal.SIGTERM)
+        time.sleep(0.2)
+
+    logging.info('Все процессы воркера остановлены')
+
+
 if __name__ == '__main__':
+    init_db()
+    _limit_threads()
+
     try:
-        ModelRegistry.reload_all()
-        logging.info('✅ Модели загружены при старте воркера')
+        warm_up()
     except Exception as e:
-        logging.exception(f'Ошибка при начальной загрузке моделей: {e}')
+        # Без прогрева нет и WORKER_READY_FILE: не разбираем очередь, а завершаемся, чтобы контейнер перезапустили
+        logging.exception(f'Ошибка при прогреве воркера: {e}')
+        sys.exit(1)
+
+    if WORKER_PROCESSES > 1 and 'tensorflow' in sys.modules:
+        logging.warning(
+            'TensorFlow нельзя использовать после fork (LSTM_RUNTIME=keras), воркер запущен одним процессом'
+        )
+    elif WORKER_PROCESSES > 1:
+        start_pool(WORKER_PROCESSES)
+        sys.exit(0)
+
+    if isinstance(engine, LocalInference):
+        thread = threading.Thread(target=model_watch, daemon=True)
+        thread.start()
+
+        weather_thread = threading.Thread(target=weather_refresh, daemon=True)
+        weather_thread.start()
+
+        dataset_thread = threading.Thread(target=dataset_refresh, daemon=True)
+        dataset_thread.start()
+
+    lease_thread = threading.Thread(target=lease_purge, daemon=True)
+    lease_thread.start()
+
+    tier_thread = threading.Thread(target=tier_report, daemon=True)
+    tier_thread.start()
 
-    thread = threading.Thread(target=daily_reload, daemon=True)
-    thread.start()
+    precompute_thread = threading.Thread(target=hourly_precompute, daemon=True)
+    precompute_thread.start()
 
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
     start_worker()
+    # Воркер остановился не по SIGTERM (потеряно соединение с RabbitMQ и т.п.): пусть оркестратор его перезапустит
+    if not stop_event.is_set():
+        sys.exit(1)
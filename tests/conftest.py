@@ -5,8 +5,10 @@ import types
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import StaticPool, create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 APP_BACKEND_DIR = os.path.join(PROJECT_ROOT, 'app', 'backend')
@@ -23,7 +25,15 @@ def fake_get_session():
         yield session
     finally:
         session.close()
+async def fake_get_async_session():
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
 fake_db_db.get_session = fake_get_session
+fake_db_db.get_async_session = fake_get_async_session
 fake_db_db.init_db = lambda: None
 sys.modules['db.db'] = fake_db_db
 
@@ -63,14 +73,21 @@ def fake_security(monkeypatch):
     yield
     sys.modules.pop('services.core.security', None)
 
-from db.db import get_session, init_db
+from db.db import get_async_session, get_session, init_db
 from main import app
 
 @pytest.fixture(name="client")
 def client_fixture(db_session):
     def get_session_override():
         return db_session
+    async def get_async_session_override():
+        # Тот же файл testing.db, что и у синхронной сессии, через aiosqlite
+        engine = create_async_engine('sqlite+aiosqlite:///testing.db')
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+        await engine.dispose()
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
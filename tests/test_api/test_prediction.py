@@ -50,3 +50,75 @@ def test_prediction_history_and_get_by_id(db_session, client, auth_headers_with_
 
     resp_404 = client.get(f'{GET_URL_BASE}/9999', headers=auth_headers_with_balance)
     assert resp_404.status_code == 404
+
+
+def test_async_create_publishes_task(db_session, client, auth_headers_with_balance, monkeypatch):
+    import api.v1.prediction as prediction_api
+
+    published = []
+
+    class FakePublisher:
+        async def publish(self, payload):
+            published.append(payload)
+
+    monkeypatch.setattr(prediction_api, 'async_task_publisher', FakePublisher())
+
+    resp_free = client.post(NYC_FREE_URL, json={'district': 4}, headers=auth_headers_with_balance)
+    assert resp_free.status_code == 201
+    assert resp_free.json()['status'] == 'pending'
+
+    resp_cost = client.post(NYC_COST_URL, json={'district': 5}, headers=auth_headers_with_balance)
+    assert resp_cost.status_code == 201
+    assert resp_cost.json()['cost'] == 20
+
+    assert [p['prediction_id'] for p in published] == [resp_free.json()['id'], resp_cost.json()['id']]
+    assert [p['district'] for p in published] == [4, 5]
+
+    history = client.post(HISTORY_URL, json={}, headers=auth_headers_with_balance).json()['history']
+    assert len(history) == 2
+
+
+def test_create_serves_precomputed_forecast_for_next_utc_hour(db_session, client, auth_headers_with_balance, monkeypatch):
+    from datetime import UTC, datetime
+
+    import api.v1.prediction as prediction_api
+    from services import forecast_manager
+    from services.forecast_manager import ForecastManager, next_hour_target
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 3, 5, 23, 30, tzinfo=UTC)
+
+    # Следующий час в UTC - полночь уже другого дня: и час, и дата берутся из одного момента
+    monkeypatch.setattr(forecast_manager, 'datetime', FrozenDatetime)
+    target = next_hour_target()
+    assert (target.day, target.hour) == (6, 0)
+    ForecastManager(db_session).save('lstmv3', 'lstm_v3-0a1b2c3d', target, [4], [[3] * 24], [[1.5] * 24])
+    monkeypatch.setattr(prediction_api, 'async_task_publisher', None)
+
+    resp = client.post(NYC_FREE_URL, json={'district': 4}, headers=auth_headers_with_balance)
+    assert resp.status_code == 201
+    assert resp.json()['status'] == 'completed'
+    assert resp.json()['hour'] == 0
+
+
+def test_sync_create_publishes_through_task_publisher(db_session, client, auth_headers_with_balance, monkeypatch):
+    import api.v1.prediction as prediction_api
+    from api.v1.schemas.prediction import NYCPredictionRequest
+    from services.user_manager import UserManager
+
+    published = []
+
+    class FakePublisher:
+        def publish(self, payload):
+            published.append(payload)
+
+    monkeypatch.setattr(prediction_api, 'task_publisher', FakePublisher())
+    user_manager = UserManager(db_session)
+    user_manager.user = user_manager.authenticate('preduser', 'pw')
+
+    pred = prediction_api.create_nyc_prediction_cost_sync(NYCPredictionRequest(district=5), user_manager)
+
+    assert pred.status == 'pending' and pred.cost == 20
+    assert [p['prediction_id'] for p in published] == [pred.id]
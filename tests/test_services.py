@@ -3,6 +3,7 @@ import sys
 
 from datetime import date, datetime, timedelta
 
+import numpy as np
 import pytest
 from sqlalchemy import func
 from sqlmodel import select
@@ -13,6 +14,9 @@ if APP_BACKEND_DIR not in sys.path:
     sys.path.insert(0, APP_BACKEND_DIR)
 
 from db.models.prediction import Prediction
+from services.forecast_cache import ForecastCache
+from services.forecast_manager import ForecastManager
+from services.lease_manager import LeaseManager
 from services.user_manager import UserManager
 
 
@@ -153,3 +157,453 @@ def test_prediction_history(db_session):
 
     assert len(history) == 2
     assert history[0].timestamp > history[1].timestamp
+
+
+def test_forecast_cache_lru_and_trip_costs():
+    cache = ForecastCache(ttl=60, max_size=2)
+    key = ('lstm_v3', 43, datetime(2024, 3, 5, 10))
+    cache.put(key, [1, 2, 3])
+    cache.put(key, [1, 2, 3], [5.0, 6.0, 7.0])
+    cache.put(key, [1, 2, 3])
+    assert cache.get(key).trip_costs == [5.0, 6.0, 7.0]
+
+    cache.put(('lstm_v3', 4, key[2]), [4])
+    cache.put(('lstm_v3', 7, key[2]), [7])
+    assert cache.get(('lstm_v3', 4, key[2])) is not None
+    assert cache.get(key) is None
+    assert cache.stats()['hits'] == 2
+
+
+def test_forecast_lease_single_owner_and_shared_result(db_session):
+    leader = LeaseManager(db_session, owner='worker-1')
+    follower = LeaseManager(db_session, owner='worker-2')
+    key = 'lstm_v3:43:2024030510'
+
+    assert leader.acquire(key)
+    assert not follower.acquire(key)
+    assert follower.get_result(key) is None
+
+    leader.publish(key, [1, 2, 3], [5.0, 6.0, 7.0])
+    assert follower.get_result(key) == ([1, 2, 3], [5.0, 6.0, 7.0])
+    assert not follower.acquire(key)
+
+
+def test_forecast_lease_release_lets_another_owner_in(db_session):
+    key = 'lstm_v3:4:2024030510'
+    assert LeaseManager(db_session, owner='worker-1').acquire(key)
+    LeaseManager(db_session, owner='worker-1').release(key)
+    assert LeaseManager(db_session, owner='worker-2').acquire(key)
+
+
+def test_prediction_served_from_precomputed_forecast(db_session):
+    um = make_um(db_session)
+    um.balance.deposit(100)
+    target = datetime(2024, 3, 5, 10)
+    ForecastManager(db_session).save('lstmv3', 'lstm_v3', target, [43, 4], [[1, 2], [3, 4]], [[5.0, 6.0], [7.0, 8.0]])
+
+    forecast = ForecastManager(db_session).get_fresh('lstmv3', 4, target)
+    pred = um.prediction.create_from_forecast(forecast, 'NYC', 20, 10)
+
+    assert pred.status == 'completed'
+    assert pred.result == '[3, 4]'
+    assert pred.trip_costs == '[7.0, 8.0]'
+    assert pred.model_version == 'lstm_v3'
+    assert um.user.balance == 80
+    assert ForecastManager(db_session).get_fresh('lstmv3', 4, datetime(2024, 3, 5, 11)) is None
+
+
+def test_numpy_lstm_matches_keras():
+    from services.core.ml_model import LSTM, NumpyLSTM
+
+    path = os.path.join(PROJECT_ROOT, 'models', 'lstm_v3', 'lstm.keras')
+    batch = np.random.default_rng(0).standard_normal((4, 72, 24)).astype(np.float32)
+    expected = LSTM(path).predict_batch(batch)
+    assert np.allclose(NumpyLSTM(path).predict_batch(batch), expected, atol=1e-3)
+
+
+def test_fused_lstm_returns_trip_counts_from_raw_features():
+    from services.core.ml_model import FusedLSTM, NumpyLSTM
+
+    path = os.path.join(PROJECT_ROOT, 'models', 'lstm_v3', 'lstm.keras')
+    reference = NumpyLSTM(path)
+    noise = np.random.default_rng(0).standard_normal((4, 72, 24))
+    raw = (reference.scaler_X.mean_ + reference.scaler_X.scale_ * noise).astype(np.float32)
+
+    trips = FusedLSTM(path).predict_trips(raw)
+    assert trips.dtype.kind == 'i' and (trips >= 0).all()
+    assert np.abs(trips - reference.predict_trips(raw)).max() <= 1
+
+
+def test_lstm_runtime_freshness_follows_content_not_mtime(monkeypatch, tmp_path):
+    import shutil
+    import joblib
+    from services.core import ml_model
+
+    path = tmp_path / 'lstm_v3'
+    shutil.copytree(os.path.join(PROJECT_ROOT, 'models', 'lstm_v3'), path)
+    model_path = str(path / 'lstm.keras')
+    fused_path = str(path / 'lstm_fused.npz')
+
+    def no_export(*args):
+        raise AssertionError('экспорт из Keras не нужен')
+
+    # Как после git checkout: исходники новее производных файлов, но содержимое то же
+    monkeypatch.setattr(ml_model, 'export_keras', no_export)
+    for name in ('lstm.keras', 'scaler_X.joblib', 'scaler_y.joblib'):
+        os.utime(path / name, (2e9, 2e9))
+    before = os.path.getmtime(fused_path)
+    ml_model.FusedLSTM(model_path)
+    assert os.path.getmtime(fused_path) == before
+
+    # Изменился скейлер: fused пересобирается из lstm.npz, Keras по-прежнему не нужен
+    scaler_y = joblib.load(path / 'scaler_y.joblib')
+    scaler_y.scale_ = scaler_y.scale_ * 2
+    joblib.dump(scaler_y, path / 'scaler_y.joblib')
+    ml_model.FusedLSTM(model_path)
+    assert ml_model.stored_source(fused_path) == ml_model._checksum(ml_model.LSTM.artifacts(model_path))
+
+
+def _text_registry(monkeypatch, tmp_path, **models):
+    from services.core import ml_model
+    from services.core.ml_model import MLModel, ModelRegistry
+
+    class TextModel(MLModel):
+        def __init__(self, model_path):
+            with open(model_path) as f:
+                super().__init__(f.read(), None, None)
+
+        def predict(self):
+            return self.model
+
+    for name, text in models.items():
+        (tmp_path / f'{name}.joblib').write_text(text)
+        monkeypatch.setitem(ml_model.registry, name, (TextModel, f'{name}_v1'))
+    monkeypatch.setattr(ModelRegistry, '_model_path', staticmethod(lambda name, path: str(tmp_path / f'{name}.joblib')))
+    monkeypatch.setattr(ModelRegistry, '_snapshot', {})
+    monkeypatch.setattr(ModelRegistry, '_fingerprints', {})
+    monkeypatch.setattr(ModelRegistry, '_footprints', {})
+    monkeypatch.setattr(ModelRegistry, '_last_used', {})
+    monkeypatch.setattr(ModelRegistry, '_reload_listeners', [])
+    monkeypatch.setattr(ml_model, '_rss_bytes', lambda: 0)
+    return ModelRegistry
+
+
+def test_model_registry_reloads_only_changed_artifacts(monkeypatch, tmp_path):
+    registry = _text_registry(monkeypatch, tmp_path, text='v1')
+    model_path = tmp_path / 'text.joblib'
+
+    first = registry.get('text')
+    assert first.predict() == 'v1' and first.version.startswith('text_v1-')
+    assert registry.reload_changed() == []
+
+    os.utime(model_path, ns=(0, 0))
+    assert registry.reload_changed() == []
+    assert registry.get('text') is first
+
+    model_path.write_text('v2')
+    assert registry.reload_changed() == ['text']
+    second = registry.get('text')
+    assert second.predict() == 'v2' and second.version != first.version
+    assert first.predict() == 'v1'
+
+
+def test_model_registry_evicts_least_recently_used_over_budget(monkeypatch, tmp_path):
+    from services.core import ml_model
+
+    size = 400 * 1024
+    registry = _text_registry(monkeypatch, tmp_path, pinned='p' * size, old='o' * size, new='n' * size)
+    monkeypatch.setattr(ml_model, 'PINNED_MODELS', ['pinned'])
+    monkeypatch.setattr(ml_model, 'MODEL_MEMORY_BUDGET_MB', 1)
+
+    assert registry.warm_up() == ['pinned']
+    registry.get('old')
+    assert set(registry.stats()) == {'pinned', 'old'}
+
+    registry.get('new')
+    stats = registry.stats()
+    assert set(stats) == {'pinned', 'new'}
+    assert stats['pinned']['pinned'] and stats['new']['memory_mb'] == 0.4
+
+
+def test_numpy_mlp_matches_sklearn_pipeline():
+    import pandas as pd
+    from services.core.ml_model import MLP, NumpyMLP
+
+    path = os.path.join(PROJECT_ROOT, 'models', 'mlp_v1', 'mlp.joblib')
+    reference, fast = MLP(path), NumpyMLP(path)
+    features = pd.DataFrame({
+        'location_id': [43, 132, -1],
+        'trips_count': [120, 15, 300],
+        'hour': [10, 3, 18],
+        'temp': [12.5, np.nan, -3.0],
+        'prcp': [0.0, 1.2, 0.0],
+        'wspd': [10.0, 4.0, 22.0],
+        'day_of_week': [1, 5, 6],
+        'month': [3, 7, 12],
+        'is_weekend': [0, 1, 1],
+        'is_holiday': [0, 0, 0],
+        'is_month_start': [0, 0, 0],
+        'is_month_end': [0, 0, 1],
+        'day_of_year': [65, 190, 366],
+        'week_of_year': [10, 27, 1],
+        'is_pre_holiday': [0, 0, 0],
+        'is_post_holiday': [0, 0, 0],
+    })
+    expected = reference.model.predict(reference.scaler_X.transform(features))
+    assert np.allclose(fast.compiled(features), expected, atol=1e-3)
+    assert np.allclose(fast.predict_batch(features), reference.predict_batch(features), atol=0.011)
+
+
+def test_cost_lut_interpolates_between_trip_knots():
+    from services.core.cost_lut import CostLUT
+
+    table = np.zeros((2, 366 * 24, 3), dtype=np.float16)
+    table[0, :, :] = [1.0, 2.0, 4.0]
+    lut = CostLUT(table, np.array([43.0, -1.0]), 2024, np.array([0.0, 100.0, 400.0], dtype=np.float32))
+
+    assert np.allclose(lut.lookup(43, datetime(2024, 3, 5, 10), [0, 50, 250, 1000]), [1.0, 1.5, 3.0, 4.0])
+    assert np.allclose(lut.lookup(43, datetime(2024, 3, 5, 10), [40, 260], interpolate=False), [1.0, 4.0])
+    assert np.allclose(lut.lookup(7, datetime(2024, 3, 5, 10), [50]), [0.0])
+    assert lut.lookup(43, datetime(2024, 12, 31, 23), [1, 2]) is None
+
+
+def test_calendar_features_mark_holidays_and_neighbours():
+    import pandas as pd
+    from services.calendar_manager import CalendarManager
+
+    dates = pd.Series(pd.to_datetime(['2024-07-03', '2024-07-04', '2024-07-05', '2024-07-06']))
+    features = CalendarManager.features(dates)
+
+    assert features['is_holiday'].tolist() == [0, 1, 0, 0]
+    assert features['is_pre_holiday'].tolist() == [1, 0, 0, 0]
+    assert features['is_post_holiday'].tolist() == [0, 0, 1, 0]
+    assert features['is_weekend'].tolist() == [0, 0, 0, 1]
+    assert features['day_of_year'].tolist() == [185, 186, 187, 188]
+
+
+def test_calendar_extends_years_safely_under_concurrent_readers(monkeypatch):
+    import threading
+    import pandas as pd
+    from services.calendar_manager import CalendarManager
+
+    monkeypatch.setattr(CalendarManager, '_tables', None)
+    CalendarManager.build(2024, 2024)
+    ranges = [pd.Series(pd.date_range(f'{year}-07-01', periods=10, freq='D')) for year in (2024, 2012, 2037, 2019, 2040)]
+    results, errors = {}, []
+
+    def read(i):
+        try:
+            dates = ranges[i % len(ranges)]
+            results[i] = CalendarManager.features(dates)['day_of_year'].tolist()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert CalendarManager._tables.years == (2012, 2040)
+    for i, days in results.items():
+        assert days == ranges[i % len(ranges)].dt.dayofyear.tolist()
+
+
+def _serving_frame():
+    import pandas as pd
+    from services.data_manager import FEATURE_COLUMNS
+
+    rows = []
+    for location_id, hours in ((43, 80), (4, 10)):
+        for i in range(hours):
+            moment = datetime(2024, 3, 1) + timedelta(hours=i)
+            row = {name: float(i + location_id) for name in FEATURE_COLUMNS}
+            row.update(location_id=location_id, date=moment.strftime('%Y-%m-%d'), hour=moment.hour)
+            rows.append(row)
+    frame = pd.DataFrame(rows).sample(frac=1, random_state=0)
+    frame.loc[frame.index[0], 'temp'] = np.nan
+    return frame
+
+
+def test_district_index_windows_and_padding(monkeypatch):
+    from services.data_manager import DataManager
+
+    monkeypatch.setattr(DataManager, '_index', None)
+    with pytest.raises(RuntimeError):
+        DataManager.current_index()
+
+    monkeypatch.setattr(DataManager, '_index', DataManager._build_index(_serving_frame()))
+    target = datetime(2024, 3, 1, 9)
+
+    window = DataManager.create_single_sequence(target, 4, past_steps=12)
+    assert window.shape == (12, 24)
+    assert np.allclose(window[:2], DataManager.current_index().means[4])
+    assert window[-1, 0] == 9 + 4
+
+    districts, windows = DataManager.create_sequences(target, past_steps=12)
+    assert districts == [4, 43]
+    assert np.array_equal(windows[0], window)
+    assert not np.isnan(windows).any()
+
+    districts, windows = DataManager.create_sequences(target, district_ids=[999], past_steps=12)
+    assert districts == [] and windows.shape == (0, 12, 24)
+    assert windows.dtype == DataManager.current_index().features.dtype
+
+    with pytest.raises(ValueError):
+        DataManager.create_single_sequence(target, 999)
+
+
+def test_incremental_lstm_continues_state_and_resyncs(monkeypatch):
+    from services.core.lstm_state import IncrementalLSTM
+    from services.core.ml_model import FusedLSTM
+    from services.data_manager import DataManager
+
+    monkeypatch.setattr(DataManager, '_index', DataManager._build_index(_serving_frame()))
+    # lstm_fused.npz не хранится в git: FusedLSTM собирает его, если файла нет
+    graph = FusedLSTM(os.path.join(PROJECT_ROOT, 'models', 'lstm_v3', 'lstm.keras')).model
+    _, window = DataManager.create_sequences(datetime(2024, 3, 2, 12), district_ids=[43])
+    _, state = graph.run(window[:, :40])
+    assert np.array_equal(graph.run(window[:, 40:], state)[0], graph(window))
+
+    forecaster = IncrementalLSTM(graph, resync_steps=2)
+    for hour in range(4):
+        ids, report = forecaster.validate(datetime(2024, 3, 2, 12 + hour), [43, 999])[::2]
+        assert ids == [43] and report['districts'] == 1
+    assert forecaster.stats == {'full': 2, 'advanced': 2, 'reused': 0}
+    forecaster.forecast(datetime(2024, 3, 2, 15), [43])
+    assert forecaster.stats['reused'] == 1
+
+    exact = IncrementalLSTM(graph, resync_steps=0)
+    for hour in range(3):
+        assert exact.validate(datetime(2024, 3, 2, 12 + hour), [43])[2]['max_abs_diff'] == 0
+
+
+def test_csv_store_round_trip_matches_csv_sequences(monkeypatch, tmp_path):
+    import json
+    from services import data_manager
+    from services.data_manager import FEATURE_COLUMNS, DataManager
+
+    for name in ('_df', '_loaded_path', '_index'):
+        monkeypatch.setattr(DataManager, name, getattr(DataManager, name))
+    csv_path = tmp_path / 'serving.csv'
+    _serving_frame().to_csv(csv_path, index=False)
+    target = datetime(2024, 3, 2, 12)
+
+    DataManager(str(csv_path))
+    expected_ids, expected = DataManager.create_sequences(target)
+    store = tmp_path / 'store'
+    DataManager.convert_csv(str(csv_path), str(store))
+
+    manifest = json.loads((store / 'manifest.json').read_text())
+    assert manifest['columns'] == FEATURE_COLUMNS
+    assert (manifest['rows'], manifest['districts'], manifest['source']) == (90, 2, str(csv_path))
+    assert np.load(store / 'districts.npy').tolist() == [[4, 0, 10], [43, 10, 90]]
+
+    for mmap in (True, False):
+        monkeypatch.setattr(data_manager, 'DATA_MMAP', mmap)
+        monkeypatch.setattr(DataManager, '_loaded_path', None)
+        DataManager(str(store))
+        assert isinstance(DataManager.current_index().features, np.memmap) == mmap
+        ids, sequences = DataManager.create_sequences(target)
+        assert ids == expected_ids
+        assert np.array_equal(sequences, expected)
+
+
+def test_publish_store_swaps_current_and_loads_mmap(monkeypatch, tmp_path):
+    from services.data_manager import DataManager
+
+    for name in ('_df', '_loaded_path', '_index'):
+        monkeypatch.setattr(DataManager, name, getattr(DataManager, name))
+    csv_path = tmp_path / 'serving.csv'
+    _serving_frame().to_csv(csv_path, index=False)
+    root = tmp_path / 'store'
+
+    first = DataManager.publish_store(str(csv_path), str(root), keep=1)
+    expected = DataManager.create_single_sequence(datetime(2024, 3, 1, 20), 43)
+    second = DataManager.publish_store(str(csv_path), str(root), keep=1)
+
+    assert os.path.realpath(root / 'current') == os.path.realpath(second)
+    assert not os.path.exists(first)
+
+    manager = DataManager(str(root / 'current'))
+    assert manager.version == os.path.realpath(second)
+    assert isinstance(DataManager.current_index().features, np.memmap)
+    assert np.array_equal(DataManager.create_single_sequence(datetime(2024, 3, 1, 20), 43), expected)
+
+
+def test_weather_lookup_falls_back_to_next_hour(monkeypatch):
+    import pandas as pd
+    from services.weather_manager import WeatherManager
+
+    monkeypatch.setattr(WeatherManager, '_snapshot', None)
+    hours = pd.to_datetime(['2024-03-05 10:00', '2024-03-05 12:00'])
+    WeatherManager._merge(pd.DataFrame({'temp': [5.0, 7.0], 'prcp': [0.0, 1.0], 'wspd': [3.0, 4.0]}, index=hours))
+
+    weather = WeatherManager.lookup(pd.date_range('2024-03-05 10:00', periods=4, freq='h'))
+    assert weather['temp'].tolist() == [5.0, 7.0, 7.0, 0.0]
+    assert weather['prcp'].tolist() == [0.0, 1.0, 1.0, 0.0]
+
+
+def test_mlp_predict_batch_matches_hourly_predict(monkeypatch):
+    import pandas as pd
+    from services.core.ml_model import MLP, NumpyMLP
+    from services.data_manager import DataManager
+    from services.weather_manager import WeatherManager
+
+    # Погода есть не на каждый час: часть часов берёт следующий час, в конце окна - нули
+    monkeypatch.setattr(WeatherManager, '_snapshot', None)
+    hours = pd.date_range('2024-07-04 12:00', periods=20, freq='h')[::3]
+    rng = np.random.default_rng(0)
+    WeatherManager._merge(pd.DataFrame({
+        'temp': rng.uniform(15, 30, len(hours)), 'prcp': rng.uniform(0, 2, len(hours)), 'wspd': rng.uniform(0, 9, len(hours)),
+    }, index=hours))
+
+    start = datetime(2024, 7, 4, 12)
+    trips = rng.integers(0, 300, 24).tolist()
+    matrix = DataManager.create_feature_matrix(43, start, trips)
+    assert (matrix['temp'] == 0).any() and (matrix['temp'] > 0).sum() > len(hours)
+
+    path = os.path.join(PROJECT_ROOT, 'models', 'mlp_v1', 'mlp.joblib')
+    for model in (MLP(path), NumpyMLP(path)):
+        hourly = []
+        for offset, count in enumerate(trips):
+            date = start + timedelta(hours=offset)
+            hourly.append(model.predict(DataManager.create_feature_vector(43, date, date.hour, count)))
+        assert model.predict_batch(matrix) == hourly
+
+
+def test_tier_latency_reports_percentiles_against_slo():
+    from services.tier_latency import TierLatency, parse_slo
+
+    assert parse_slo('gold:15, bronze:300') == {'gold': 15.0, 'bronze': 300.0}
+
+    latency = TierLatency(slo={'gold': 2.0, 'bronze': 60.0}, window=100)
+    for seconds in range(1, 11):
+        latency.observe('gold', seconds / 10)
+        latency.observe('bronze', seconds * 10)
+    latency.observe('silver', -1)
+
+    report = latency.report()
+    assert report['gold']['count'] == 10 and report['gold']['ok'] is True
+    assert report['bronze']['p95'] > 60 and report['bronze']['ok'] is False
+    assert report['silver'] == {'count': 1, 'p50': 0.0, 'p95': 0.0, 'max': 0.0, 'slo': None, 'ok': True}
+
+
+def test_fair_scheduler_round_robins_users_by_weight():
+    from services.fair_scheduler import FairScheduler
+
+    scheduler = FairScheduler()
+    for i in range(6):
+        scheduler.push('heavy', f'h{i}')
+    scheduler.push('light', 'l0')
+    scheduler.push('gold', 'g0', weight=2)
+    scheduler.push('gold', 'g1', weight=2)
+    scheduler.push('gold', 'g2', weight=2)
+
+    assert scheduler.take(6) == ['h0', 'l0', 'g0', 'g1', 'h1', 'g2']
+    assert scheduler.backlog() == {'heavy': 4}
+
+    scheduler.push('late', 'x0')
+    assert scheduler.take(10) == ['h2', 'x0', 'h3', 'h4', 'h5']
+    assert len(scheduler) == 0
@@ -4,6 +4,7 @@ import sys
 from types import SimpleNamespace
 
 import numpy as np
+import pytest
 from sklearn.preprocessing import StandardScaler
 from unittest.mock import MagicMock, patch
 
@@ -22,6 +23,11 @@ from services.user_manager import UserManager
 class DummyChannel:
     def __init__(self):
         self.published = None
+        self.is_open = True
+        self.confirming = False
+
+    def confirm_delivery(self):
+        self.confirming = True
 
     def basic_publish(self, exchange, routing_key, body, properties):
         self.published = SimpleNamespace(
@@ -40,6 +46,10 @@ class DummyConnection:
         self._channel = channel
         self.closed = False
 
+    @property
+    def is_open(self):
+        return not self.closed
+
     def channel(self):
         return self._channel
 
@@ -47,12 +57,21 @@ class DummyConnection:
         self.closed = True
 
 
-def test_post_process_returns_non_negative_ints():
-    scaler = StandardScaler()
-    scaler.fit(np.array([[0], [10], [20]]))
-    result = worker.post_process(np.array([-2.4, 3.3, 0.0]), scaler)
-    assert all(isinstance(x, int) for x in result)
-    assert all(x >= 0 for x in result)
+def test_lstm_predict_trips_returns_non_negative_ints():
+    from services.core.ml_model import LSTM
+
+    class ScaledOutput:
+        def predict(self, batch, batch_size, verbose):
+            return np.array([[-2.4, 3.3, 0.0]])
+
+    scaler_y = StandardScaler()
+    scaler_y.fit(np.array([[0], [10], [20]]))
+    model = LSTM.__new__(LSTM)
+    model.model, model.scaler_X, model.scaler_y = ScaledOutput(), StandardScaler().fit(np.zeros((2, 3))), scaler_y
+
+    trips = model.predict_trips(np.zeros((1, 72, 3)))
+    assert trips.dtype.kind == 'i'
+    assert trips.tolist() == [[0, 37, 10]]
 
 
 def test_callback_invokes_process_and_acks(monkeypatch):
@@ -93,6 +112,7 @@ def test_publish_prediction_creates_record_and_message(db_session, monkeypatch):
 
     monkeypatch.setattr(publisher, 'get_session', fake_session)
     monkeypatch.setattr(publisher, 'get_rabbitmq_connection', fake_conn)
+    monkeypatch.setattr(publisher, 'task_publisher', publisher.TaskPublisher(size=2))
 
     pred = publisher.publish_prediction_task(
         user_id=um.user.id,
@@ -105,4 +125,624 @@ def test_publish_prediction_creates_record_and_message(db_session, monkeypatch):
 
     assert pred.id is not None
     assert dummy_ch.published.body['prediction_id'] == pred.id
+    assert dummy_ch.confirming is True
+
+    # Соединение остаётся открытым и переиспользуется следующей публикацией
+    publisher.publish_prediction_task(
+        user_id=dummy_ch.published.body['user_id'], model='lstm', city='spb', cost=0, district=2, hour=3,
+    )
+    assert dummy_ch.published.body['prediction_id'] != pred.id
+    assert publisher.task_publisher.connects == 1
+    assert dummy_conn.closed is False
+
+    publisher.task_publisher.close()
     assert dummy_conn.closed is True
+
+
+def test_task_publisher_reconnects_after_connection_loss(monkeypatch):
+    from pika.exceptions import StreamLostError
+
+    class BrokenChannel(DummyChannel):
+        def basic_publish(self, exchange, routing_key, body, properties):
+            raise StreamLostError('Transport indicated EOF')
+
+    connections = [DummyConnection(BrokenChannel()), DummyConnection(DummyChannel())]
+    opened = iter(connections)
+
+    def fake_conn():
+        conn = next(opened)
+        return conn, conn.channel(), 'ml_tasks'
+
+    monkeypatch.setattr(publisher, 'get_rabbitmq_connection', fake_conn)
+    pool = publisher.TaskPublisher(size=1)
+    pool.publish({'prediction_id': 7})
+
+    assert connections[0].closed is True
+    assert connections[1].channel().published.body == {'prediction_id': 7}
+    assert pool.connects == 2
+
+
+def test_warm_up_runs_models_before_marking_ready(monkeypatch, tmp_path):
+    ready_file = tmp_path / 'worker.ready'
+    ready_file.write_text('stale')
+    calls = []
+
+    def fake_warm(**kwargs):
+        calls.append(ready_file.exists())
+        return {}
+
+    monkeypatch.setattr(worker, 'READY_FILE', str(ready_file))
+    monkeypatch.setattr(worker.engine, 'warm', fake_warm)
+
+    assert worker.warm_up() >= 0
+    assert calls == [False]
+    assert ready_file.read_text() != 'stale'
+
+
+def test_warm_up_failure_leaves_worker_not_ready(monkeypatch, tmp_path):
+    ready_file = tmp_path / 'worker.ready'
+    ready_file.write_text('stale')
+
+    def broken_warm(**kwargs):
+        raise ConnectionError('сервер инференса недоступен')
+
+    monkeypatch.setattr(worker, 'READY_FILE', str(ready_file))
+    monkeypatch.setattr(worker.engine, 'warm', broken_warm)
+
+    with pytest.raises(ConnectionError):
+        worker.warm_up()
+    assert not ready_file.exists()
+
+
+def test_warm_skips_model_passes_on_empty_dataset(monkeypatch):
+    from services.core.ml_model import ModelRegistry
+    from services.inference import LocalInference
+
+    class EmptyData:
+        def touch(self):
+            return 0
+
+        def create_sequences(self, target):
+            return [], np.zeros((0, 72, 24), dtype=np.float32)
+
+    engine = LocalInference.__new__(LocalInference)
+    engine.data = EmptyData()
+    monkeypatch.setattr(ModelRegistry, 'warm_up', lambda names=None: ['lstmv3', 'mlp'])
+    monkeypatch.setattr(ModelRegistry, 'get', lambda name: pytest.fail(f'прогон {name} на пустом датасете'))
+
+    assert engine.warm()['data_mb'] == 0
+
+
+def test_inference_server_batches_requests_from_clients(tmp_path):
+    import threading
+    from datetime import datetime
+    from services.inference import RemoteInference
+    from workers.inference_server import InferenceServer
+
+    class FakeEngine:
+        def __init__(self):
+            self.calls = []
+
+        def forecast(self, model_name, target, district_ids):
+            self.calls.append(district_ids)
+            return 'v1', district_ids, [[d, d] for d in district_ids]
+
+        def version(self, model_name):
+            return f'{model_name}-v1'
+
+        def data_version(self):
+            return 'data-1'
+
+    engine = FakeEngine()
+    path = str(tmp_path / 'inference.sock')
+    server = InferenceServer(engine, path, batch_size=8, batch_timeout_ms=200, authkey=b'test-key')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = RemoteInference(path, timeout=5, authkey=b'test-key')
+    client.warm()
+
+    target = datetime(2024, 3, 5, 10)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda d=d: results.__setitem__(d, client.forecast('lstmv3', target, [d, 999])))
+        for d in (4, 43)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert engine.calls == [[4, 43, 999]]
+    assert results[4] == ('v1', [4, 999], [[4, 4], [999, 999]])
+    assert client.version('lstmv3') == 'lstmv3-v1'
+
+
+def test_inference_server_and_client_require_authkey(tmp_path):
+    from services.inference import RemoteInference
+    from workers.inference_server import InferenceServer
+
+    path = str(tmp_path / 'inference.sock')
+    with pytest.raises(ValueError):
+        InferenceServer(object(), path, authkey=b'')
+    with pytest.raises(ValueError):
+        RemoteInference(path, authkey=b'')
+
+
+def test_worker_pool_restarts_crashed_processes(monkeypatch, tmp_path):
+    import signal
+    import threading
+    import time
+
+    log = tmp_path / 'children.log'
+
+    def fake_child(slot):
+        crashed_before = log.exists() and f'{slot}\n' in log.read_text()
+        with open(log, 'a') as f:
+            f.write(f'{slot}\n')
+        if slot == 0 and not crashed_before:
+            os._exit(3)
+        time.sleep(30)
+
+    monkeypatch.setattr(worker, '_run_child', fake_child)
+    monkeypatch.setattr(worker, 'WORKER_RESTART_DELAY_SECONDS', 0.05)
+    previous = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    timer = threading.Timer(1.5, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    try:
+        worker.start_pool(2)
+    finally:
+        timer.cancel()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+    assert sorted(log.read_text().split()) == ['0', '0', '1']
+
+
+class FakeMessage:
+    def __init__(self, task):
+        self.body = json.dumps(task).encode()
+        self.redelivered = False
+        self.acked = self.requeued = None
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue):
+        self.requeued = requeue
+
+
+def _fake_rabbitmq(monkeypatch, messages):
+    class FakeQueue:
+        async def consume(self, callback):
+            for message in messages:
+                await callback(message)
+            return 'tag'
+
+        async def cancel(self, tag):
+            self.cancelled = tag
+
+    class FakeChannel:
+        async def set_qos(self, prefetch_count):
+            self.prefetch = prefetch_count
+
+        async def declare_queue(self, name, durable, arguments=None):
+            self.arguments = arguments
+
+        async def get_queue(self, name, ensure):
+            return FakeQueue()
+
+        async def close(self):
+            pass
+
+    class FakeConnection:
+        closed = False
+
+        async def channel(self):
+            return FakeChannel()
+
+        async def close(self):
+            FakeConnection.closed = True
+
+    async def fake_connect(**kwargs):
+        return FakeConnection()
+
+    monkeypatch.setattr(worker.aio_pika, 'connect_robust', fake_connect)
+    return FakeConnection
+
+
+def test_async_worker_bounds_concurrency_and_acks(monkeypatch):
+    import asyncio
+    import threading
+    import time
+
+    messages = [FakeMessage({'prediction_id': i}) for i in range(7)]
+    connection = _fake_rabbitmq(monkeypatch, messages)
+
+    lock = threading.Lock()
+    state = {'running': 0, 'max': 0, 'done': 0}
+
+    def fake_process_batch(tasks):
+        with lock:
+            state['running'] += 1
+            state['max'] = max(state['max'], state['running'])
+        time.sleep(0.1)
+        with lock:
+            state['running'] -= 1
+            state['done'] += 1
+            if state['done'] == len(messages):
+                worker.stop_event.set()
+        if tasks[0]['prediction_id'] == 3:
+            raise RuntimeError('boom')
+
+    monkeypatch.setattr(worker, 'process_batch', fake_process_batch)
+    monkeypatch.setattr(worker, 'stop_event', threading.Event())
+    monkeypatch.setattr(worker, 'BATCH_SIZE', 1)
+
+    asyncio.run(worker.consume_async(concurrency=3))
+
+    assert state['max'] == 3
+    assert connection.closed is True
+    assert [m.acked for m in messages] == [True, True, True, None, True, True, True]
+    assert messages[3].requeued is True
+
+
+def test_async_worker_interleaves_users_from_buffer(monkeypatch):
+    import asyncio
+    import threading
+
+    # Пользователь 1 успел поставить пачку задач раньше пользователей 2 и 3
+    tasks = [{'prediction_id': i, 'user_id': 1, 'priority': 0} for i in range(5)]
+    tasks += [{'prediction_id': 5, 'user_id': 2, 'priority': 0}, {'prediction_id': 6, 'user_id': 3, 'priority': 0}]
+    messages = [FakeMessage(task) for task in tasks]
+    _fake_rabbitmq(monkeypatch, messages)
+
+    order = []
+
+    def fake_process_batch(batch):
+        order.extend(task['user_id'] for task in batch)
+        if len(order) == len(messages):
+            worker.stop_event.set()
+
+    monkeypatch.setattr(worker, 'process_batch', fake_process_batch)
+    monkeypatch.setattr(worker, 'stop_event', threading.Event())
+    monkeypatch.setattr(worker, 'BATCH_SIZE', 1)
+    monkeypatch.setattr(worker, 'FAIR_BUFFER', 16)
+
+    asyncio.run(worker.consume_async(concurrency=1))
+
+    assert order == [1, 2, 3, 1, 1, 1, 1]
+    assert all(m.acked for m in messages)
+
+
+def test_task_priority_follows_status_and_payment(db_session, monkeypatch):
+    from workers import connection
+
+    assert publisher.task_priority('bronze', False) == 0
+    assert publisher.task_priority('bronze', True) == 1
+    assert publisher.task_priority('silver', True) < publisher.task_priority('gold', False)
+    assert publisher.task_priority('diamond', True) == connection.QUEUE_MAX_PRIORITY
+
+    um = _register_user(db_session)
+    um.user.status = 'gold'
+    db_session.commit()
+    pred = um.prediction.create_prediction(model='lstmv3', city='NYC', cost=10, district=4, hour=5)
+    payload = publisher.task_payload(pred, um.user.status)
+    assert (payload['tier'], payload['priority']) == ('gold', 5)
+
+    dummy_ch = DummyChannel()
+    dummy_conn = DummyConnection(dummy_ch)
+    monkeypatch.setattr(publisher, 'get_rabbitmq_connection', lambda: (dummy_conn, dummy_ch, 'ml_tasks'))
+    publisher.TaskPublisher(size=1).publish(payload)
+    assert dummy_ch.published.properties.priority == 5
+
+
+def test_priority_queue_falls_back_when_queue_exists_without_it(monkeypatch):
+    from pika.exceptions import ChannelClosedByBroker
+    from workers import connection
+
+    declared = []
+
+    class FakeChannel:
+        def queue_declare(self, queue, durable, arguments=None):
+            declared.append(arguments)
+            if arguments:
+                raise ChannelClosedByBroker(406, "PRECONDITION_FAILED - inequivalent arg 'x-max-priority'")
+
+    class FakeBlockingConnection:
+        def __init__(self, params):
+            pass
+
+        def channel(self):
+            return FakeChannel()
+
+    monkeypatch.setattr(connection.pika, 'BlockingConnection', FakeBlockingConnection)
+    conn, channel, name = connection.get_rabbitmq_connection()
+
+    assert name == connection.QUEUE_NAME
+    assert declared == [{'x-max-priority': connection.QUEUE_MAX_PRIORITY}, None]
+
+
+class StubEngine:
+    # Вместо моделей: прогноз района d на n-м вызове forecast - [d + n] * 24
+    def __init__(self):
+        self.data = 'data-1'
+        self.calls = []
+
+    def version(self, model_name):
+        return f'{model_name}-0a1b2c3d'
+
+    def data_version(self):
+        return self.data
+
+    def forecast(self, model_name, target, district_ids=None):
+        self.calls.append((model_name, sorted(district_ids)))
+        return self.version(model_name), district_ids, [[d + len(self.calls)] * 24 for d in district_ids]
+
+    def costs(self, district, target, trips):
+        return [1.5] * 24
+
+
+def _stub_worker(monkeypatch, db_session):
+    from sqlmodel import Session
+
+    stub = StubEngine()
+
+    def fake_session():
+        # Как в проде: своя сессия на пакет, закрывается в конце process_batch
+        yield Session(db_session.get_bind())
+
+    monkeypatch.setattr(worker, 'engine', stub)
+    monkeypatch.setattr(worker, 'get_session', fake_session)
+    monkeypatch.setattr(worker, 'forecast_cache', worker.ForecastCache())
+    return stub
+
+
+def _batch_tasks(um, specs):
+    tasks = []
+    for model, district, cost in specs:
+        pred = um.prediction.create_prediction(model=model, city='nyc', cost=cost, district=district, hour=10)
+        tasks.append(publisher.task_payload(pred, um.user.status))
+    return tasks
+
+
+def _results(session, tasks):
+    from db.models.prediction import Prediction
+
+    session.expire_all()
+    return [session.get(Prediction, task['prediction_id']) for task in tasks]
+
+
+def test_coalescing_ignores_lease_results_of_previous_dataset(db_session, monkeypatch):
+    stub = _stub_worker(monkeypatch, db_session)
+    um = _register_user(db_session)
+
+    first = _batch_tasks(um, [('lstmv3', 4, 0)])
+    worker.process_batch(first)
+    assert _results(db_session, first)[0].result == str([5] * 24)
+
+    # Другая реплика (пустой локальный кэш) с тем же датасетом берёт готовый результат из forecastlease
+    worker.forecast_cache.clear()
+    shared = _batch_tasks(um, [('lstmv3', 4, 0)])
+    worker.process_batch(shared)
+    assert len(stub.calls) == 1
+    assert _results(db_session, shared)[0].result == str([5] * 24)
+
+    # После переключения датасета результат по старым данным не переиспользуется
+    stub.data = 'data-2'
+    worker.forecast_cache.clear()
+    fresh = _batch_tasks(um, [('lstmv3', 4, 0)])
+    worker.process_batch(fresh)
+    assert len(stub.calls) == 2
+    assert _results(db_session, fresh)[0].result == str([6] * 24)
+
+
+def test_process_batch_fans_out_duplicate_tasks(db_session, monkeypatch):
+    stub = _stub_worker(monkeypatch, db_session)
+    um = _register_user(db_session)
+
+    tasks = _batch_tasks(um, [('lstmv3', 4, 0), ('lstmv3', 7, 0), ('lstmv3', 4, 20)])
+    worker.process_batch(tasks)
+
+    # Район 4 посчитан один раз, оба задания получили один результат; платное - ещё и стоимость поездок
+    assert stub.calls == [('lstmv3', [4, 7])]
+    free, other, paid = _results(db_session, tasks)
+    assert free.status == paid.status == other.status == worker.TaskStatus.COMPLETED
+    assert free.result == paid.result == str([5] * 24)
+    assert paid.trip_costs == str([1.5] * 24)
+    assert free.model_version == 'lstmv3-0a1b2c3d'
+
+
+def test_coalescing_computes_itself_when_owner_stalls(db_session, monkeypatch):
+    from services.lease_manager import LeaseManager
+
+    stub = _stub_worker(monkeypatch, db_session)
+    monkeypatch.setattr(worker, 'COALESCE_WAIT_SECONDS', 0.3)
+    monkeypatch.setattr(worker, 'COALESCE_POLL_SECONDS', 0.05)
+    um = _register_user(db_session)
+    tasks = _batch_tasks(um, [('lstmv3', 4, 0)])
+
+    # Прогноз уже взяла другая реплика и не публикует результат
+    key = worker._cache_key(stub.version('lstmv3'), tasks[0])
+    assert LeaseManager(db_session, owner='other:1').acquire(worker._lease_key(key, stub.data))
+
+    worker.process_batch(tasks)
+
+    assert stub.calls == [('lstmv3', [4])]
+    assert _results(db_session, tasks)[0].result == str([5] * 24)
+
+
+class FakeBlockingChannel:
+    def __init__(self, bodies):
+        self.pending = [json.dumps(body).encode() for body in bodies]
+        self.log = []
+        self.prefetch = None
+        self.on_message = None
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback):
+        self.on_message = on_message_callback
+
+    def basic_ack(self, delivery_tag):
+        self.log.append(('ack', delivery_tag))
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.log.append(('nack', delivery_tag, requeue))
+
+
+class FakeBlockingConnection:
+    # Отдаёт все сообщения при первом process_data_events, на пустой очереди останавливает воркер
+    def __init__(self, channel):
+        self.channel = channel
+        self.tag = 0
+
+    def process_data_events(self, time_limit):
+        if not self.channel.pending:
+            worker.stop_event.set()
+        while self.channel.pending:
+            self.tag += 1
+            method = SimpleNamespace(delivery_tag=self.tag, redelivered=False)
+            self.channel.on_message(self.channel, method, None, self.channel.pending.pop(0))
+
+    def close(self):
+        pass
+
+
+def _fake_blocking_rabbitmq(monkeypatch, bodies, batch_size, fair_buffer=0):
+    import threading
+
+    channel = FakeBlockingChannel(bodies)
+    monkeypatch.setattr(worker, 'get_rabbitmq_connection', lambda: (FakeBlockingConnection(channel), channel, 'ml_tasks'))
+    monkeypatch.setattr(worker, 'stop_event', threading.Event())
+    monkeypatch.setattr(worker, 'WORKER_MODE', 'blocking')
+    monkeypatch.setattr(worker, 'BATCH_SIZE', batch_size)
+    monkeypatch.setattr(worker, 'BATCH_TIMEOUT_MS', 0)
+    monkeypatch.setattr(worker, 'FAIR_BUFFER', fair_buffer)
+    return channel
+
+
+def test_process_batch_stacks_each_model_into_one_pass(db_session, monkeypatch):
+    stub = _stub_worker(monkeypatch, db_session)
+    um = _register_user(db_session)
+
+    tasks = _batch_tasks(um, [('lstmv3', 4, 0), ('lstm', 4, 0), ('lstmv3', 43, 0), ('lstm', 7, 0), ('lstmv3', 7, 0)])
+    worker.process_batch(tasks)
+
+    assert sorted(stub.calls) == [('lstm', [4, 7]), ('lstmv3', [4, 7, 43])]
+    assert all(pred.status == worker.TaskStatus.COMPLETED for pred in _results(db_session, tasks))
+
+
+def test_batch_worker_acks_only_after_commit(db_session, monkeypatch):
+    from db.models.prediction import Prediction
+    from sqlmodel import Session
+
+    _stub_worker(monkeypatch, db_session)
+    um = _register_user(db_session)
+    tasks = _batch_tasks(um, [('lstmv3', 4, 0), ('lstmv3', 7, 0), ('lstmv3', 43, 0)])
+    channel = _fake_blocking_rabbitmq(monkeypatch, tasks, batch_size=2)
+
+    acked_statuses = []
+    record_ack = channel.basic_ack
+
+    def basic_ack(delivery_tag):
+        # Подтверждённая задача уже закоммичена: её видит отдельная сессия
+        with Session(db_session.get_bind()) as session:
+            acked_statuses.append(session.get(Prediction, tasks[delivery_tag - 1]['prediction_id']).status)
+        record_ack(delivery_tag)
+
+    channel.basic_ack = basic_ack
+    worker.start_worker()
+
+    assert channel.prefetch == 2
+    assert channel.log == [('ack', 1), ('ack', 2), ('ack', 3)]
+    assert acked_statuses == [worker.TaskStatus.COMPLETED] * 3
+
+
+def test_batch_worker_requeues_batch_on_db_error_and_keeps_consuming(monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    channel = _fake_blocking_rabbitmq(monkeypatch, [{'prediction_id': 1}, {'prediction_id': 2}], batch_size=1,
+                                      fair_buffer=1)
+    processed = []
+
+    def fake_process_batch(tasks):
+        if not processed:
+            processed.append(None)
+            raise OperationalError('SELECT', {}, Exception('БД недоступна'))
+        processed.extend(task['prediction_id'] for task in tasks)
+
+    monkeypatch.setattr(worker, 'process_batch', fake_process_batch)
+    worker.start_worker()
+
+    assert processed == [None, 2]
+    assert channel.log == [('nack', 1, True), ('ack', 2)]
+
+
+def test_batch_size_one_keeps_single_message_consumer(monkeypatch):
+    channel = _fake_blocking_rabbitmq(monkeypatch, [{'prediction_id': 1}, {'prediction_id': 2}], batch_size=1)
+    processed = []
+
+    def fake_process_prediction(task):
+        if task['prediction_id'] == 1:
+            raise RuntimeError('ошибка БД')
+        processed.append(task['prediction_id'])
+
+    monkeypatch.setattr(worker, 'process_prediction', fake_process_prediction)
+    monkeypatch.setattr(worker, 'process_batch', lambda tasks: pytest.fail('пакетный путь при WORKER_BATCH_SIZE=1'))
+    worker.start_worker()
+
+    assert channel.prefetch == 1
+    assert processed == [2]
+    assert channel.log == [('nack', 1, True), ('ack', 2)]
+
+
+def test_async_publisher_retries_while_channel_reopens():
+    import asyncio
+    from aio_pika.exceptions import ChannelInvalidStateError
+    from workers.async_publisher import AsyncTaskPublisher
+
+    sent = []
+
+    class FakeExchange:
+        async def publish(self, message, routing_key):
+            if not sent:
+                sent.append(None)
+                raise ChannelInvalidStateError('канал переоткрывается')
+            sent.append(json.loads(message.body))
+
+    async def fake_channel():
+        return SimpleNamespace(default_exchange=FakeExchange())
+
+    pool = AsyncTaskPublisher()
+    pool._channel = fake_channel
+    asyncio.run(pool.publish({'prediction_id': 7, 'priority': 1}))
+
+    assert sent == [None, {'prediction_id': 7, 'priority': 1}]
+
+
+def test_async_publisher_closes_connection_when_setup_fails(monkeypatch):
+    import asyncio
+    from workers import async_publisher
+
+    connections = []
+
+    class FakeConnection:
+        closed = False
+
+        async def channel(self, publisher_confirms):
+            raise ConnectionError('канал не открылся')
+
+        async def close(self):
+            self.closed = True
+
+    async def fake_connect_robust(host):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(async_publisher.aio_pika, 'connect_robust', fake_connect_robust)
+    pool = async_publisher.AsyncTaskPublisher(channels=2)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            asyncio.run(pool.publish({'prediction_id': 7}))
+
+    assert len(connections) == 2 and all(c.closed for c in connections)